@@ -1,4 +1,6 @@
+import os
 import numpy as np
+from sketch_common import id_dtype, power_many
 
 # def matrix_rank_finite_field(matrix, p):
 #     """
@@ -70,16 +72,207 @@ def inverse_matrix(matrix, p = None):
     
     Args:
         matrix (list[list[float]] or np.ndarray): The square matrix.
+        p (int, optional): Invert exactly over the integers mod p instead.
         
     Returns:
         np.ndarray: The inverse matrix.
     """
     if p is not None :
-        matrix = np.array(matrix, dtype=int) % p
-        inv = np.linalg.inv(matrix).astype(int) % p
-        for i in range(len(inv)) :
-            for j in range(len(inv)) :
-                inv[i][j] = inv[i][j] % p
-        return inv
+        matrix = np.array(matrix, dtype=id_dtype(p)) % p
+        n = len(matrix)
+        inv, ok = solve_mod(np.broadcast_to(matrix, (n, n, n)), np.eye(n, dtype=matrix.dtype), p)
+        if not ok.all() :
+            raise np.linalg.LinAlgError("Singular matrix mod p")
+        return inv.T
     else :
-        return np.linalg.inv(matrix)
\ No newline at end of file
+        return np.linalg.inv(matrix)
+
+
+def solve_mod(A, b, p):
+    """
+    Solve a stack of systems A[n] @ x[n] == b[n] (mod p) by Gauss-Jordan elimination.
+
+    Args:
+        A: (N, k, k) integer matrices.
+        b: (N, k) right-hand sides.
+
+    Returns:
+        (x, ok): x of shape (N, k) with entries in [0, p), and a mask of the
+        systems that are nonsingular mod p (x is meaningless where ok is False).
+    """
+    dtype = id_dtype(p)
+    A = np.asarray(A).astype(dtype) % p
+    b = np.asarray(b).astype(dtype) % p
+    N, k = b.shape
+    M = np.concatenate([A, b[:, :, None]], axis=2)
+    ok = np.ones(N, dtype=bool)
+    systems = np.arange(N)
+    for col in range(k) :
+        nonzero = M[:, col:, col] != 0
+        ok &= nonzero.any(axis=1)
+        pivot = col + nonzero.argmax(axis=1)
+        top = M[systems, col].copy()
+        M[systems, col] = M[systems, pivot]
+        M[systems, pivot] = top
+        M[:, col] = M[:, col] * power_many(M[:, col, col], p - 2, p)[:, None] % p
+        factor = M[:, :, col].copy()
+        factor[:, col] = 0
+        M = (M - factor[:, :, None] * M[:, None, col]) % p
+    return M[:, :, k], ok
+
+
+def rank_mod(A, p):
+    """Ranks of a stack of (N, rows, cols) integer matrices over the integers mod p, by batched elimination."""
+    A = np.asarray(A).astype(id_dtype(p)) % p
+    N, rows, cols = A.shape
+    rank = np.zeros(N, dtype=np.int64)
+    free = np.arange(rows)
+    for col in range(cols) :
+        candidate = (A[:, :, col] != 0) & (free[None, :] >= rank[:, None])
+        has = candidate.any(axis=1)
+        s = np.flatnonzero(has)
+        pivot = candidate[s].argmax(axis=1)
+        target = rank[s]
+        top = A[s, target].copy()
+        A[s, target] = A[s, pivot]
+        A[s, pivot] = top
+        A[s, target] = A[s, target] * power_many(A[s, target, col], p - 2, p)[:, None] % p
+        factor = A[s, :, col].copy()
+        factor[np.arange(len(s)), target] = 0
+        A[s] = (A[s] - factor[:, :, None] * A[s, target][:, None, :]) % p
+        rank += has
+    return rank
+
+
+def det_many(m):
+    """Exact integer determinants of a stack of small square matrices (Laplace expansion)."""
+    n = m.shape[-1]
+    if n == 1 :
+        return m[..., 0, 0]
+    det = 0
+    for j in range(n) :
+        minor = np.delete(m[..., 1:, :], j, axis=-1)
+        det = det + (-1) ** j * m[..., 0, j] * det_many(minor)
+    return det
+
+def adjugate_many(m):
+    """Integer adjugates of a stack of small square matrices, so that inv = adj / det."""
+    n = m.shape[-1]
+    if n == 1 :
+        return np.ones_like(m)
+    adj = np.empty_like(m)
+    for i in range(n) :
+        for j in range(n) :
+            minor = np.delete(np.delete(m, i, axis=-2), j, axis=-1)
+            adj[..., j, i] = (-1) ** (i + j) * det_many(minor)
+    return adj
+
+_catalogue = {}
+
+def full_rank_catalogue(k, rc, cache_dir=None):
+    """
+    Full-rank candidate matrices of brute_force_k2_2d(k, rc) with their exact inverses.
+
+    Built once per process for each (k, rc). When `cache_dir` (or the
+    FERMAT_CATALOGUE_DIR environment variable) is set, the tables are also
+    saved there and loaded on the next run.
+
+    Returns:
+        (g, adj, det): g and adj of shape (N, k, k), det of shape (N,), with
+        inverse(g[n]) == adj[n] / det[n], in brute_force_k2_2d order.
+    """
+    if (k, rc) in _catalogue :
+        return _catalogue[(k, rc)]
+    cache_dir = cache_dir or os.environ.get("FERMAT_CATALOGUE_DIR")
+    path = os.path.join(cache_dir, f"catalogue_k{k}_rc{rc}.npz") if cache_dir else None
+    if path and os.path.exists(path) :
+        data = np.load(path)
+        entry = (data["g"], data["adj"], data["det"])
+    else :
+        g = np.array(list(brute_force_k2_2d(k, rc)), dtype=np.int64).reshape(-1, k, k)
+        det = det_many(g)
+        g, det = g[det != 0], det[det != 0]
+        entry = (g, adjugate_many(g), det)
+        if path :
+            os.makedirs(cache_dir, exist_ok=True)
+            np.savez(path, g=entry[0], adj=entry[1], det=entry[2])
+    for arr in entry :
+        arr.flags.writeable = False
+    _catalogue[(k, rc)] = entry
+    return entry
+
+def singleton_kbucket(counts, ids, index, p, hash, g):
+    """
+    Cheap check for a k-bucket holding a single flow: every sub-bucket then has
+    count == g * c and id == g * c * f, so f = id / count must agree everywhere.
+
+    Returns:
+        [(flow_id, count)] or [] when the bucket is not a verified singleton.
+    """
+    if any(x <= 0 for x in counts) :
+        return []
+    f = ids[0] * pow(counts[0], p - 2, p) % p
+    if any((x - f * n) % p for n, x in zip(counts, ids)) :
+        return []
+    if hash(f) != index :
+        return []
+    c = set()
+    for j, n in enumerate(counts) :
+        gj = g(f, j)
+        if n % gj :
+            return []
+        c.add(n // gj)
+    if len(c) != 1 :
+        return []
+    return [(f, c.pop())]
+
+def pure_kbucket(counts, ids, index, k, rc, p, hash, g, stats=None):
+    """
+    Search for the flows behind one k-bucket of a row.
+
+    Args:
+        counts, ids: the k sub-bucket counters.
+        index: position of the k-bucket in its row.
+        p: the id modulus.
+        hash: hash(f) -> k-bucket index of flow f in this row.
+        g: g(f, j) -> coefficient of flow f in sub-bucket j.
+        stats (dict, optional): counts how many buckets each path resolved
+            ("singleton", "matrix") or left "undecoded".
+
+    Returns:
+        list[(flow_id, count)], or [] when no candidate matrix verifies.
+    """
+    counts = [int(x) for x in counts[:k]]
+    ids = [int(x) % p for x in ids[:k]]
+    found = singleton_kbucket(counts, ids, index, p, hash, g)
+    if found :
+        _record(stats, "singleton")
+        return found
+    for kk in range(k, 0, -1) :
+        gm, adj, det = full_rank_catalogue(kk, rc)
+        a = np.array(counts[:kk], dtype=np.int64)
+        # c = inverse(g) @ a must be a positive integer vector
+        num = adj @ a
+        ok = np.all(num % det[:, None] == 0, axis=1)
+        c = num[ok] // det[ok][:, None]
+        cand = np.flatnonzero(ok)[np.all(c > 0, axis=1)]
+        c = c[np.all(c > 0, axis=1)]
+        if len(cand) == 0 :
+            continue
+        # solve (g @ diag(c)) @ f == id (mod p) for every surviving candidate at once
+        id = np.array(ids[:kk], dtype=id_dtype(p))
+        f, solved = solve_mod(gm[cand] * (c % p)[:, None, :], np.broadcast_to(id, (len(cand), kk)), p)
+        for n in np.flatnonzero(solved) :
+            fn = [int(x) for x in f[n]]
+            if any(hash(x) != index for x in fn) :
+                continue
+            if any(g(fn[x], j) != gm[cand[n]][j][x] for j in range(kk) for x in range(kk)) :
+                continue
+            _record(stats, "matrix")
+            return [(fn[j], int(c[n][j])) for j in range(kk)]
+    _record(stats, "undecoded")
+    return []
+
+def _record(stats, path):
+    if stats is not None :
+        stats[path] = stats.get(path, 0) + 1
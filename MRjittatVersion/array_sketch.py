@@ -0,0 +1,188 @@
+import random
+from collections import defaultdict
+import numpy as np
+from sketch_common import ArrayCounters, allocate, check_params, id_dtype
+from .bucket import g_array
+from .MrJittacore import pure_kbucket
+
+
+class ArraySketch(ArrayCounters) :
+	"""MRjittat sketch with count and id kept as (rows, m, k) arrays."""
+	variant = "mrjittat"
+
+	def __init__(self, rows_cnt, buckets_cnt, p, k, rc, seed=None, params=None, arrays=None) :
+		"""
+		Hash seeds come from `seed` or `params` ({"a", "b"}: one per row,
+		{"ga", "gb"}: rows x k, shared by every k-bucket of a row) as described
+		in sketch_common.Mergeable. MRjittatVersion.sketch.Sketch draws a
+		coefficient hash per bucket instead, so neither its params nor its
+		hashes for the same seed carry over to this engine.
+		`arrays` is an optional (count, id) pair of existing buffers to use as
+		counters instead of fresh zeroed ones (see sketch_format).
+		"""
+		self.rows_cnt = rows_cnt
+		self.buckets_cnt = buckets_cnt
+		self.p = p
+		self.k = k
+		self.rc = rc
+		self.dtype = id_dtype(p)
+		if params is None :
+			params = self.make_params(rows_cnt, p, k, seed)
+		check_params(params, {"a": (rows_cnt,), "b": (rows_cnt,), "ga": (rows_cnt, k), "gb": (rows_cnt, k)})
+		self._a = np.array(params["a"], dtype=self.dtype)
+		self._b = np.array(params["b"], dtype=self.dtype)
+		self._ga = np.array(params["ga"], dtype=self.dtype)
+		self._gb = np.array(params["gb"], dtype=self.dtype)
+		self.count, self.id = allocate((rows_cnt, buckets_cnt, k), self.dtype, arrays)
+		self.pure_elements = []
+		self.flowset = defaultdict(int)
+		self.decode_stats = {}
+
+	@staticmethod
+	def make_params(rows_cnt, p, k, seed=None) :
+		"""Fresh hash seeds, drawn from random.Random(seed), else from the global random module."""
+		rng = random if seed is None else random.Random(seed)
+		# one k-bucket hash per row, one coefficient hash per (row, sub-bucket)
+		return {
+			"a": [rng.randint(1, p - 1) for _ in range(rows_cnt)],
+			"b": [rng.randint(0, p - 1) for _ in range(rows_cnt)],
+			"ga": [[rng.randint(1, p - 1) for _ in range(k)] for _ in range(rows_cnt)],
+			"gb": [[rng.randint(0, p - 1) for _ in range(k)] for _ in range(rows_cnt)],
+		}
+
+	@classmethod
+	def describe(cls, rows_cnt, buckets_cnt, p, k, rc, seed=None, params=None) :
+		"""(meta(), counter shape, id dtype) of cls(...) with the same arguments, without allocating its counters."""
+		params = cls.make_params(rows_cnt, p, k, seed) if params is None else params
+		check_params(params, {"a": (rows_cnt,), "b": (rows_cnt,), "ga": (rows_cnt, k), "gb": (rows_cnt, k)})
+		params = {"a": [int(x) for x in params["a"]], "b": [int(x) for x in params["b"]],
+			"ga": [[int(x) for x in row] for row in params["ga"]], "gb": [[int(x) for x in row] for row in params["gb"]]}
+		meta = {"rows_cnt": rows_cnt, "buckets_cnt": buckets_cnt, "p": p, "k": k, "rc": rc, "params": params}
+		return meta, (rows_cnt, buckets_cnt, k), id_dtype(p)
+
+	@property
+	def params(self) :
+		return {"a": self._a.tolist(), "b": self._b.tolist(), "ga": self._ga.tolist(), "gb": self._gb.tolist()}
+
+	def meta(self) :
+		"""Constructor arguments that rebuild an identically-hashed empty sketch."""
+		return {"rows_cnt": self.rows_cnt, "buckets_cnt": self.buckets_cnt, "p": self.p, "k": self.k, "rc": self.rc, "params": self.params}
+
+	def dimensions(self) :
+		return self.rows_cnt, self.buckets_cnt, self.p, self.k, self.rc
+
+	def hash(self, f) :
+		"""k-bucket index of flow `f` in every row."""
+		return ((self._a * (f % self.p) + self._b) % self.p % self.buckets_cnt).astype(np.intp)
+
+	def g(self, f) :
+		"""(rows, k) coefficients of flow `f`."""
+		h = ((self._ga * (f % self.p) + self._gb) % self.p % self.rc).astype(np.intp)
+		return g_array(self.k, self.rc)[np.arange(self.k), h]
+
+	def insert(self, f) :
+		h = self.hash(f)
+		g = self.g(f)
+		rows = np.arange(self.rows_cnt)
+		self.count[rows, h] += g
+		self.id[rows, h] = (self.id[rows, h] + g.astype(self.dtype) * (f % self.p)) % self.p
+		return g
+
+	def insert_many(self, flow_ids, counts=None, rows=None) :
+		"""
+		Insert a batch of flows (optionally with per-flow packet counts) in one vectorized pass.
+		`rows` (a slice or index array) limits the update to those rows, so processes
+		sharing the counters can insert into disjoint rows concurrently.
+		"""
+		f = (np.asarray(flow_ids) % self.p).astype(self.dtype).reshape(-1)
+		c = np.ones(len(f), dtype=np.int64) if counts is None else np.broadcast_to(np.asarray(counts, dtype=np.int64), f.shape)
+		rows = np.arange(self.rows_cnt)[slice(None) if rows is None else rows]
+		h = (self._a[rows, None] * f + self._b[rows, None]) % self.p % self.buckets_cnt
+		gh = ((self._ga[rows, None, :] * f[None, :, None] + self._gb[rows, None, :]) % self.p % self.rc).astype(np.intp)
+		g = g_array(self.k, self.rc)[np.arange(self.k), gh]
+		idx = (((h + rows[:, None] * self.buckets_cnt) * self.k)[:, :, None] + np.arange(self.k)).astype(np.intp).reshape(-1)
+		count = self.count.reshape(-1)
+		id = self.id.reshape(-1)
+		np.add.at(count, idx, (g * c[None, :, None]).reshape(-1))
+		np.add.at(id, idx, (g.astype(self.dtype) * (f * c % self.p)[None, :, None] % self.p).reshape(-1))
+		if len(idx) >= len(rows) * self.buckets_cnt * self.k :
+			for r in rows :
+				self.id[r] %= self.p
+		else :
+			id[idx] %= self.p
+
+	def delete(self, f, cnt, residual=None) :
+		"""Subtract `cnt` packets of `f` from the counters, or from the residual dict when given (see peel)."""
+		h = self.hash(f)
+		g = self.g(f)
+		if residual is not None :
+			for i, j in enumerate(h.tolist()) :
+				count, id = self.state(i, j, residual)
+				residual[(i, j)] = count - cnt * g[i], (id - g[i].astype(self.dtype) * (f * cnt % self.p)) % self.p
+			return
+		rows = np.arange(self.rows_cnt)
+		self.count[rows, h] -= cnt * g
+		self.id[rows, h] = (self.id[rows, h] - g.astype(self.dtype) * (f * cnt % self.p)) % self.p
+
+	def state(self, i, j, residual=None) :
+		"""(count, id) k-vectors of k-bucket (i, j), as held in `residual` if it has them."""
+		if residual is not None and (i, j) in residual :
+			return residual[(i, j)]
+		return self.count[i, j], self.id[i, j]
+
+	def get_count(self, i, j) :
+		return self.count[i, j].tolist()
+
+	def pure_verification(self, i, j, stats=None, residual=None) :
+		count, id = self.state(i, j, residual)
+		return pure_kbucket(count.tolist(), id.tolist(), j, self.k, self.rc, self.p,
+			lambda f : int(self.hash(f)[i]), lambda f, x : int(self.g(f)[i, x]), stats)
+
+	def clear(self) :
+		"""Zero the counters in place and forget decoded flows, keeping the hash seeds."""
+		self.count.fill(0)
+		self.id.fill(0)
+		self.pure_elements = []
+		self.flowset = defaultdict(int)
+		self.decode_stats = {}
+
+	def copy(self) :
+		"""Independent in-memory sketch with the same seeds and a copy of the counters."""
+		return type(self)(**self.meta(), arrays=(np.array(self.count), np.array(self.id)))
+
+	def verify(self) :
+		"""
+		Decode without modifying the counters: peel against a residual dict
+		that only holds the k-buckets a decoded flow was taken out of, so
+		repeated calls return the same flows, read-only or larger-than-RAM
+		memory-mapped counters decode without being copied, and the sketch
+		can still be merged, stored or inserted into afterwards.
+		"""
+		self.flowset = defaultdict(int)
+		return self.peel(residual={})
+
+	def peel(self, residual=None) :
+		"""
+		Peel in rounds: each round visits its pending k-buckets in ascending
+		(row, bucket) order and the next round is every k-bucket a decoded
+		flow touched, so memory-mapped counters are paged in sequentially.
+		Decoded flows are subtracted from the counters, or with a `residual`
+		dict, recorded there as {(row, k-bucket): (count, id)} instead.
+		"""
+		self.decode_stats = {}
+		pending = [(i, int(j)) for i in range(self.rows_cnt) for j in np.flatnonzero(self.count[i].any(axis=1))]
+		while pending :
+			touched = set()
+			for i, j in pending :
+				if not self.state(i, j, residual)[0].any() :
+					continue
+				for f, cnt in self.pure_verification(i, j, self.decode_stats, residual) :
+					self.delete(f, cnt, residual)
+					touched.update(enumerate(self.hash(f).tolist()))
+					self.flowset[f] += cnt
+			pending = sorted(touched)
+		return dict(self.flowset)
+
+	@property
+	def nbytes(self) :
+		return self.count.nbytes + self.id.nbytes
@@ -1,36 +1,58 @@
 import random
+from functools import lru_cache
+import numpy as np
+from sketch_common import id_dtype
 
 prime = [2,3,5,7,11,13,17,19,23,29,31,37,41,43,47,53,59,61,67,71,73,79,83,89,97, 101,103,107,109,113,127,131,137,139,149,151,157,163,167,173,179,181,191,193,197,199]
+
+@lru_cache(maxsize=None)
+def g_table(k, rc) :
+	"""k x rc coefficient table shared by every bucket with the same (k, rc); row i belongs to sub-bucket i."""
+	return tuple(tuple(prime[r + i * rc] for r in range(rc)) for i in range(k))
+
+@lru_cache(maxsize=None)
+def g_array(k, rc) :
+	table = np.array(g_table(k, rc), dtype=np.int64)
+	table.flags.writeable = False
+	return table
+
 class Bucket() :
-	def __init__(self,p,rc,k):
+	def __init__(self,p,rc,k,rng=random,a=None,b=None):
 		self.count = 0
 		self.id = 0
 		self.p = p
 		self.rc = rc
-		self._a = random.randint(1, p - 1)
-		self._b = random.randint(0, p - 1)
+		self._a = rng.randint(1, p - 1) if a is None else a
+		self._b = rng.randint(0, p - 1) if b is None else b
 		self.k = k
+		self._table = g_table(k, rc)
 		# print("Bucket init _a",self._a,"_b",self._b)
 		pass
 	
 	def g(self, f, i) :
-		arr = [[prime[i + j * self.rc] for i in range(self.rc)] for j in range(self.k)]
-		# print("g array",arr)
-		# arr = [419,569,241,151,29,13]
-		return arr[i][(self._a * f + self._b) % self.p % (self.rc)]
+		"""Coefficient of flow `f` in sub-bucket `i`; `f` may also be a list or array of flow ids."""
+		if np.ndim(f) > 0 :
+			f = (np.asarray(f) % self.p).astype(id_dtype(self.p))
+			h = ((self._a * f + self._b) % self.p % self.rc).astype(np.intp)
+			return g_array(self.k, self.rc)[i][h]
+		return self._table[i][(self._a * f + self._b) % self.p % self.rc]
 
 
 	def insert(self, flow_id, i):
-		# print(f"g({flow_id}) = ",self.g(flow_id,i))
-		self.count += self.g(flow_id,i)
-		self.id += self.g(flow_id,i) * flow_id 
-		return self.g(flow_id,i)
+		g = self.g(flow_id,i)
+		self.count += g
+		self.id += g * flow_id 
+		return g
 
 	def delete(self, flow_id, cnt,i):
-		if self.count < cnt * self.g(flow_id,i) :
-			self.count = 0
-		self.count -= cnt * self.g(flow_id,i)
-		self.id = (self.id - self.g(flow_id,i) * flow_id * cnt) % self.p 
+		self.count, self.id = self.removed(self.count, self.id, flow_id, cnt, i)
+
+	def removed(self, count, id, flow_id, cnt, i) :
+		"""(count, id) left once `cnt` packets of `flow_id` are taken out of (count, id); the bucket is not changed."""
+		g = self.g(flow_id,i)
+		if count < cnt * g :
+			count = 0
+		return count - cnt * g, (id - g * flow_id * cnt) % self.p
 	
 				
 
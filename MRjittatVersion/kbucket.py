@@ -1,8 +1,11 @@
 import random
 from .bucket import Bucket
 class Kbucket() :
-	def __init__(self,k,p,rc):
-		self.buckets = [Bucket(p,rc,k) for _ in range(k)]
+	def __init__(self,k,p,rc,rng=random,ga=None,gb=None):
+		if ga is not None :
+			self.buckets = [Bucket(p,rc,k,a=a,b=b) for a, b in zip(ga, gb)]
+		else :
+			self.buckets = [Bucket(p,rc,k,rng) for _ in range(k)]
 		self.k = k
 		pass
 
@@ -16,6 +19,14 @@ class Kbucket() :
 		for i,bucket in enumerate(self.buckets):
 			bucket.delete(f,cnt,i)
 
+	def removed(self, f, cnt, counts, ids) :
+		"""(counts, ids) left once `cnt` packets of `f` are taken out of (counts, ids); the buckets are not changed."""
+		state = [bucket.removed(c, d, f, cnt, i) for i, (bucket, c, d) in enumerate(zip(self.buckets, counts, ids))]
+		return [c for c, _ in state], [d for _, d in state]
+
 	def get_count(self) :
 		return [bucket.count for bucket in self.buckets]
+
+	def get_id(self) :
+		return [bucket.id for bucket in self.buckets]
 	
\ No newline at end of file
@@ -1,55 +1,56 @@
-from sketch import Sketch
+from .sketch import Sketch
+from trial_runner import run_trials
+from result_cache import ResultCache
 from collections import Counter
 import random
 import matplotlib.pyplot as plt
 import numpy as np
 
-def experiment_buckets(rows_cnt, buckets_list, element_range, element_counts, trials=5, p=int(1e9 + 7)):
+def bucket_trial(rng, rows_cnt, buckets_cnt, element_counts, p):
+	sketch = Sketch(rows_cnt, buckets_cnt, p, k=2,rc =10)
+
+	# Generate random elements
+	# elements = rng.sample(range(1, element_range), k=element_counts)
+	elements = [i for i in range(1,element_counts + 1)]
+	original_counts = Counter(elements)
+
+	# Insert elements into sketch
+	for elem in elements:
+		for row in range(rows_cnt):
+			sketch.rows[row].insert(elem)
+
+	# Recover flow counts
+	recovered = sketch.verify()
+
+	# Calculate false positives and false negatives
+	fp = sum(1 for f in recovered if f not in original_counts)
+	fn = sum(1 for f in original_counts if f not in recovered)
+	acc = (element_counts - (fn + fp)) / element_counts * 100
+	return {"fp": fp, "fn": fn, "acc": acc}
+
+def experiment_buckets(rows_cnt, buckets_list, element_range, element_counts, trials=5, p=int(1e9 + 7), seed=None, workers=None, cache=None):
 	mean_fp_list = []
 	mean_fn_list = []
 	mean_acc_list = []
 	print(f"Experimenting with rows: {rows_cnt}, element range: {element_range}, element counts: {element_counts}, trials per bucket count: {trials}")
 
 	for buckets_cnt in buckets_list:
-		fp_trials = []
-		fn_trials = []
-		acc_trials = []
 		print(f"Running experiments for {buckets_cnt} buckets...")
-
-		for _ in range(trials):
-			# print("trial:",_ )
-			sketch = Sketch(rows_cnt, buckets_cnt, p, k=2,rc =10)
-
-			# Generate random elements
-			# elements = random.sample(range(1, element_range), k=element_counts)
-			elements = [i for i in range(1,element_counts + 1)]
-			original_counts = Counter(elements)
-
-			# Insert elements into sketch
-			for elem in elements:
-				for row in range(rows_cnt):
-					sketch.rows[row].insert(elem)
-
-			# Recover flow counts
-			recovered = sketch.verify()
-
-			# Calculate false positives and false negatives
-			fp = sum(1 for f in recovered if f not in original_counts)
-			fn = sum(1 for f in original_counts if f not in recovered)
-
-			# fp_trials.append(fp / len(original_counts))  # normalized
-			fp_trials.append(fp )
-			
-			fn_trials.append(fn )
-			# fn_trials.append(fn / len(original_counts))  # normalized
-			acc = (element_counts - (fn + fp)) / element_counts * 100
-			acc_trials.append(acc)
+		# only seeded runs are repeatable, so only those go through the result cache
+		config = {"kind": "experiment_buckets", "sketch": "MrJittat", "rows": rows_cnt, "buckets": buckets_cnt, "k": 2, "rc": 10,
+			"element_counts": element_counts, "p": p, "trials": trials, "seed": seed}
+		result = cache.get(config) if cache is not None and seed is not None else None
+		if result is None:
+			result = run_trials(bucket_trial, trials, (rows_cnt, buckets_cnt, element_counts, p),
+				seed=None if seed is None else (seed, buckets_cnt), workers=workers)
+			if cache is not None and seed is not None:
+				cache.put(config, result)
 
 		# Compute mean for this bucket count
-		print("success_rate : ", (element_counts - (sum(fn_trials) + sum(fp_trials))/ trials) / element_counts * 100)
-		mean_fp_list.append(sum(fp_trials) / trials)
-		mean_fn_list.append(sum(fn_trials) / trials)
-		mean_acc_list.append(sum(acc_trials) / trials)
+		print("success_rate : ", (element_counts - (result["fn"] + result["fp"])) / element_counts * 100)
+		mean_fp_list.append(result["fp"])
+		mean_fn_list.append(result["fn"])
+		mean_acc_list.append(result["acc"])
 
 		if debug:
 			print(f"Buckets: {buckets_cnt}, Mean FP: {mean_fp_list[-1]:.4f}, Mean FN: {mean_fn_list[-1]:.4f}")
@@ -115,12 +116,14 @@ def plot_results_buckets(buckets_list, fp_list, fn_list,acc):
 	plt.show()
 
 debug = False
-bucket_list = [100 * i for i in range(1, 5)]
-element_range = 10000
-element_counts = 100
-trials = 5
-fp_list, fn_list ,acc = experiment_buckets(2, bucket_list, element_range, element_counts, trials)
-plot_results_buckets(bucket_list, fp_list, fn_list,acc)
+
+if __name__ == "__main__":
+	bucket_list = [100 * i for i in range(1, 5)]
+	element_range = 10000
+	element_counts = 100
+	trials = 5
+	fp_list, fn_list ,acc = experiment_buckets(2, bucket_list, element_range, element_counts, trials, seed=0, cache=ResultCache())
+	plot_results_buckets(bucket_list, fp_list, fn_list,acc)
 
 # rows_cnt = 1
 # buckets_cnt = 100
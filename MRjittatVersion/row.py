@@ -1,16 +1,18 @@
 import random
 from .bucket import Bucket
 from .kbucket import Kbucket
-from .MrJittacore import  brute_force_k2_2d, inverse_matrix
-import numpy as np
+from .MrJittacore import pure_kbucket
 
 class Rows() :
-	def __init__(self,m,p,k,rc):
-		self.kbuckets = [Kbucket(k,p,rc) for _ in range(m)]
+	def __init__(self,m,p,k,rc,rng=random,a=None,b=None,ga=None,gb=None):
+		if ga is not None :
+			self.kbuckets = [Kbucket(k,p,rc,ga=ga_j,gb=gb_j) for ga_j, gb_j in zip(ga, gb)]
+		else :
+			self.kbuckets = [Kbucket(k,p,rc,rng) for _ in range(m)]
 		self.p = p
 		self.m = m
-		self._a = random.randint(1, p - 1)
-		self._b = random.randint(0, p - 1)
+		self._a = rng.randint(1, p - 1) if a is None else a
+		self._b = rng.randint(0, p - 1) if b is None else b
 		self.k = k
 		self.rc = rc
 		pass
@@ -24,56 +26,11 @@ class Rows() :
 		return self.kbuckets[h].insert(f)
 		# return h
 
-	def pure_verification(self, i) :
-
-		answer = []
-		# print(a)
-		count = 0
-		for kk in range(self.k, 0, -1) :
-			a = np.array([bucket.count for bucket in self.kbuckets[i].buckets][:kk], dtype=int).reshape(-1, 1)
-			id = np.array([bucket.id for bucket in self.kbuckets[i].buckets][:kk], dtype=int).reshape(-1, 1)
-			for g in brute_force_k2_2d(kk,self.rc) :
-				g = np.array(g, dtype=int)
-				# print("g",g)
-				rank =  np.linalg.matrix_rank(g)
-				# print("rank",rank)
-				if rank < kk :
-					continue
-				try :
-					inv = inverse_matrix(g)
-					c = (inv @ a)
-					if not np.allclose(c, np.round(c), atol=1e-10):
-						continue
-					if np.any(c < 0) :
-						continue
-					c = np.round(c).astype(int)
-					c_diag = np.diagflat(c)
-					gc = (g @ c_diag) 
-					gc_inv = inverse_matrix(gc)
-					f = (gc_inv @ id)
-					#close round
-					if not np.allclose(f, np.round(f), atol=1e-10):
-						continue
-					f = np.round(f).astype(int)
-					flag = True
-					for idx in range(len(f)) :
-						if self.hash(int(f[idx][0])) != i :
-							flag = False
-							break
-					for j in range(len(g)) :
-						for k in range(len(f)):
-							# print(f"g[{j}][{k}] = {g[j][k]}, bucket.g({int(f[k][0])}) = {self.kbuckets[i].buckets[j].g(int(f[k][0]))}")
-							if self.kbuckets[i].buckets[j].g(int(f[k][0]),j) != g[j][k] :
-								flag = False
-								break
-					if flag :
-						# print(f"found pure: {f.flatten()}, count: {c.flatten()}")
-						return [(int(f[j][0]),int(c[j][0])) for j in range(len(f))]
-						answer.append( [(int(f[idx][0]), int(c[idx][0])) for idx in range(len(f))])
-				except np.linalg.LinAlgError : 
-					# print("not invertible")
-					pass
-		return []
+	def pure_verification(self, i, stats=None, state=None) :
+		"""Flows decoded from k-bucket `i`, or from its (counts, ids) `state` when given."""
+		kbucket = self.kbuckets[i]
+		counts, ids = (kbucket.get_count(), kbucket.get_id()) if state is None else state
+		return pure_kbucket(counts, ids, i, self.k, self.rc, self.p, self.hash, lambda f, j : kbucket.buckets[j].g(f, j), stats)
 
 	
 	def delete(self, f, cnt) :
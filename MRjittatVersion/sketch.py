@@ -1,53 +1,97 @@
+import random
+from sketch_common import BucketCounters, check_params
 from .row import Rows
 from collections import deque, defaultdict
 import numpy as np
 
 
-class Sketch :
-	def __init__(self, rows_cnt, buckets_cnt, p,k,rc) :
+class Sketch(BucketCounters) :
+	def __init__(self, rows_cnt, buckets_cnt, p,k,rc,seed=None,params=None) :
+		"""
+		Hash seeds come from `seed` or `params` ({"a", "b"}: one k-bucket hash
+		per row, {"ga", "gb"}: rows x buckets x k, one coefficient hash per
+		bucket) as described in sketch_common.Mergeable. The array engine
+		shares one coefficient hash per (row, sub-bucket) instead, so neither
+		its params nor its hashes for the same seed carry over to this one.
+		"""
 		self.rows_cnt = rows_cnt
 		self.p = p
-		self.rows = [Rows(buckets_cnt, p,k,rc) for _ in range(rows_cnt)]
+		self.rc = rc
+		if params is not None :
+			check_params(params, {"a": (rows_cnt,), "b": (rows_cnt,),
+				"ga": (rows_cnt, buckets_cnt, k), "gb": (rows_cnt, buckets_cnt, k)})
+			self.rows = [Rows(buckets_cnt, p,k,rc,a=a,b=b,ga=ga,gb=gb)
+				for a, b, ga, gb in zip(params["a"], params["b"], params["ga"], params["gb"])]
+		else :
+			rng = random if seed is None else random.Random(seed)
+			self.rows = [Rows(buckets_cnt, p,k,rc,rng) for _ in range(rows_cnt)]
 		self.pure_elements = []
 		self.flowset = defaultdict(int)
+		self.decode_stats = {}
 		self.k = k
 
+	@property
+	def params(self) :
+		return {"a": [row._a for row in self.rows], "b": [row._b for row in self.rows],
+			"ga": [[[bucket._a for bucket in kbucket.buckets] for kbucket in row.kbuckets] for row in self.rows],
+			"gb": [[[bucket._b for bucket in kbucket.buckets] for kbucket in row.kbuckets] for row in self.rows]}
+
+	def dimensions(self) :
+		return self.rows_cnt, len(self.rows[0].kbuckets), self.p, self.k, self.rc
+
+	def buckets(self) :
+		return [bucket for row in self.rows for kbucket in row.kbuckets for bucket in kbucket.buckets]
+
+	def state(self, i, j, residual=None) :
+		"""(counts, ids) of k-bucket j of row i, as held in `residual` if it has them."""
+		if residual is not None and (i, j) in residual :
+			return residual[(i, j)]
+		kbucket = self.rows[i].kbuckets[j]
+		return kbucket.get_count(), kbucket.get_id()
+
 	def verify(self):
+		"""
+		Decode without changing the sketch: every k-bucket a decoded flow is
+		taken out of gets its residual (counts, ids) in a side table keyed by
+		(row, k-bucket), and the buckets themselves are only read, so
+		repeated calls return the same flows and the sketch stays usable.
+		"""
+		self.flowset = defaultdict(int)
+		return self.peel(residual={})
+
+	def peel(self, residual=None):
+		"""
+		Decode by peeling. Without `residual` every decoded flow is subtracted
+		from the buckets; with a dict, the subtractions go there instead.
+		"""
+		self.decode_stats = {}
 		queue = deque()
-		checked_pure = set()
-		stop = 0
+		queued = set()
 		for i, row in enumerate(self.rows):
 			for j, kbucket in enumerate(row.kbuckets):
-				if kbucket.buckets[0].count > 0:
+				if np.count_nonzero(kbucket.get_count()) > 0:
 					queue.append((i, j))
+					queued.add((i, j))
 		
 		while len(queue) > 0:
-			# print("Queue length:", len(queue))
-			# print("Current queue:", list(queue))
 			i, j = queue.popleft()
-			# print(f"Verifying row {i}, bucket {j}")
-			# kbucket = self.rows[i].kbuckets[j]
-			# print(f"Processing bucket at row {i}, index {j} with count {bucket.count} and id {bucket.id}")
-			c = self.rows[i].kbuckets[j].get_count()
-			if np.count_nonzero(c) == 0 :
+			queued.discard((i, j))
+			state = self.state(i, j, residual)
+			if np.count_nonzero(state[0]) == 0 :
 				continue
-			k = self.rows[i].pure_verification(j)
-			# print("get",k)
-			# break
-			if len(k) == 0:
-				queue.append((i, j))
-				stop += 1
-				if stop >= len(queue) + 1 :
-					# print("Cannot decode further, stopping.")
-					break
-			else :
-				# print("pure",k)
-				for f, cnt in k:
-					for row in self.rows:
-						# print("delete",int(f),int(cnt))
+			k = self.rows[i].pure_verification(j, self.decode_stats, state)
+			# an undecodable bucket is dropped; it comes back only once a deletion touches it
+			for f, cnt in k:
+				for i2, row in enumerate(self.rows):
+					h = row.hash(f)
+					if residual is None :
 						row.delete(f, cnt)
+					else :
+						residual[(i2, h)] = row.kbuckets[h].removed(f, cnt, *self.state(i2, h, residual))
+					if (i2, h) not in queued and np.count_nonzero(self.state(i2, h, residual)[0]) > 0:
+						queue.append((i2, h))
+						queued.add((i2, h))
 				self.flowset[f] += cnt
-				stop = 0
 		return dict(self.flowset)
 
 	def insert(self, f):
@@ -0,0 +1,95 @@
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+import numpy as np
+
+
+class EpochManager:
+    """
+    Double-buffered, time-windowed measurement over identically-seeded
+    sketches: inserts go to the active one while sealed ones from earlier
+    windows are decoded in the background.
+
+    Every `window` seconds (checked on insert, or forced with rotate()) the
+    active sketch is sealed and replaced by a spare under the insert lock,
+    so ingest never waits for a decode. Sealed sketches are decoded on
+    `executor` (a single background thread by default), then cleared and
+    put back in the spare pool; when a decode is still running at the next
+    boundary, a fresh spare is allocated instead of waiting for it. Each
+    epoch's result dict goes to `on_result`, if given, and to the `results`
+    queue:
+
+        epoch, start, end, packets, flows (decoded {flow id: count}),
+        ingest_seconds (time spent inside insert_many),
+        decode_seconds (time spent peeling),
+        latency (from sealing to the result being delivered)
+    """
+    def __init__(self, sketch, window=1.0, on_result=None, executor=None, clock=time.monotonic):
+        self.active = sketch
+        self.spares = [type(sketch)(**sketch.meta())]
+        self.window = window
+        self.on_result = on_result
+        self.clock = clock
+        self.results = queue.Queue()
+        self.own = executor is None
+        self.executor = ThreadPoolExecutor(max_workers=1) if executor is None else executor
+        self.lock = threading.Lock()
+        self.pending = set()
+        self.epoch = 0
+        self.start = clock()
+        self.packets = 0
+        self.ingest_seconds = 0.0
+
+    def insert_many(self, flow_ids, counts=None):
+        with self.lock:
+            if self.clock() - self.start >= self.window:
+                self.seal()
+            begin = time.perf_counter()
+            self.active.insert_many(flow_ids, counts)
+            self.ingest_seconds += time.perf_counter() - begin
+            self.packets += len(flow_ids) if counts is None else int(np.sum(counts))
+
+    def rotate(self):
+        """Seal the active sketch, start decoding it and carry on inserting into a spare."""
+        with self.lock:
+            return self.seal()
+
+    def seal(self):
+        # caller holds self.lock
+        sealed = self.active
+        self.active = self.spares.pop() if self.spares else type(sealed)(**sealed.meta())
+        end = self.clock()
+        stats = {"epoch": self.epoch, "start": self.start, "end": end,
+                 "packets": self.packets, "ingest_seconds": self.ingest_seconds}
+        self.epoch += 1
+        self.start = end
+        self.packets = 0
+        self.ingest_seconds = 0.0
+        future = self.executor.submit(self.decode, sealed, stats, time.perf_counter())
+        self.pending.add(future)
+        future.add_done_callback(self.pending.discard)
+        return future
+
+    def decode(self, sealed, stats, sealed_at):
+        begin = time.perf_counter()
+        try:
+            # the sealed sketch is cleared right after, so peel it in place rather than copying it
+            stats["flows"] = sealed.peel()
+            stats["decode_seconds"] = time.perf_counter() - begin
+        finally:
+            sealed.clear()
+            with self.lock:
+                self.spares.append(sealed)
+        stats["latency"] = time.perf_counter() - sealed_at
+        self.results.put(stats)
+        if self.on_result is not None:
+            self.on_result(stats)
+        return stats
+
+    def close(self):
+        """Seal and decode the current epoch, wait for every decode and stop the background worker."""
+        self.rotate()
+        wait(list(self.pending))
+        if self.own:
+            self.executor.shutdown()
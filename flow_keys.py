@@ -0,0 +1,143 @@
+import numpy as np
+
+# packed 13-byte 5-tuple, as captured off the wire
+FLOW_DTYPE = np.dtype([("src", ">u4"), ("dst", ">u4"), ("sport", ">u2"), ("dport", ">u2"), ("proto", "u1")])
+# smallest Mersenne prime above 2**104, so every 5-tuple is its own field element
+EXACT_PRIME = 2 ** 107 - 1
+
+
+def limbs(tuples):
+    """(hi, lo) uint64 limbs of a FLOW_DTYPE array: hi = src:dst, lo = sport:dport:proto (40 bits)."""
+    tuples = np.asarray(tuples, dtype=FLOW_DTYPE)
+    hi = tuples["src"].astype(np.uint64) << np.uint64(32) | tuples["dst"].astype(np.uint64)
+    lo = (tuples["sport"].astype(np.uint64) << np.uint64(24) | tuples["dport"].astype(np.uint64) << np.uint64(8)
+          | tuples["proto"].astype(np.uint64))
+    return hi, lo
+
+
+def mix(x):
+    """splitmix64 finalizer over a uint64 array."""
+    x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+
+def encode(tuples, p):
+    """
+    Flow ids below p for an array of 5-tuples.
+
+    With p > 2**104 (e.g. EXACT_PRIME) the id is the tuple itself read as a
+    104-bit integer, so decoding is exact, at the cost of Python-int
+    counters. With a small p (int64 counters) the id is a 64-bit hash of
+    the tuple reduced mod p - 1: distinct flows collide with probability
+    about n**2 / 2p, and a KeyIndex is needed to map ids back.
+    """
+    hi, lo = limbs(tuples)
+    if p > 2 ** 104:
+        return hi.astype(object) * (1 << 40) + lo.astype(object)
+    with np.errstate(over="ignore"):
+        h = mix(mix(hi) ^ lo)
+    return (h % np.uint64(p - 1)).astype(np.int64) + 1
+
+
+def decode_exact(ids):
+    """
+    (FLOW_DTYPE array, valid mask) of the tuples behind exact (p > 2**104)
+    flow ids; ids of 2**104 or more cannot be tuples and are masked out.
+    """
+    ids = np.asarray(ids, dtype=object).reshape(-1)
+    valid = np.array([0 <= f < 1 << 104 for f in ids.tolist()], dtype=bool)
+    ids = np.where(valid, ids, 0)
+    lo = (ids % (1 << 40)).astype(np.uint64)
+    hi = (ids // (1 << 40)).astype(np.uint64)
+    tuples = np.empty(len(ids), dtype=FLOW_DTYPE)
+    tuples["src"] = hi >> np.uint64(32)
+    tuples["dst"] = hi & np.uint64(0xFFFFFFFF)
+    tuples["sport"] = lo >> np.uint64(24)
+    tuples["dport"] = (lo >> np.uint64(8)) & np.uint64(0xFFFF)
+    tuples["proto"] = lo & np.uint64(0xFF)
+    return tuples, valid
+
+
+class KeyIndex:
+    """
+    Reverse index from hashed flow ids to 5-tuples, held as one sorted id
+    array plus the matching tuple records (21 bytes per flow) instead of a
+    dict of Python objects. Batches are buffered and merged on lookup.
+    """
+    def __init__(self, p):
+        self.p = p
+        self.ids = np.empty(0, dtype=np.int64)
+        self.tuples = np.empty(0, dtype=FLOW_DTYPE)
+        self.pending = []
+        # (id, tuple) pairs that lost their id to an earlier tuple; collisions should be rare
+        self.collided = set()
+        self.collisions = 0
+
+    def add(self, tuples, ids=None):
+        """Record a batch of tuples (and their ids, if already encoded); returns the ids."""
+        tuples = np.asarray(tuples, dtype=FLOW_DTYPE).reshape(-1)
+        ids = encode(tuples, self.p) if ids is None else np.asarray(ids, dtype=np.int64)
+        self.pending.append((ids, tuples))
+        return ids
+
+    def compact(self):
+        """
+        Merge pending batches into the sorted arrays. An id keeps the tuple it
+        was first indexed with; any other tuple hashing to it is a collision,
+        counted once per distinct (id, tuple) pair.
+        """
+        if not self.pending:
+            return
+        ids = np.concatenate([batch[0] for batch in self.pending])
+        tuples = np.concatenate([batch[1] for batch in self.pending])
+        self.pending = []
+        # a stable sort keeps insertion order within an id, so each group starts with its first tuple
+        order = np.argsort(ids, kind="stable")
+        ids, tuples = ids[order], tuples[order]
+        first = np.ones(len(ids), dtype=bool)
+        first[1:] = ids[1:] != ids[:-1]
+        group = np.cumsum(first) - 1
+        batch_ids, kept = ids[first], tuples[first]
+        pos = np.minimum(np.searchsorted(self.ids, batch_ids), max(len(self.ids) - 1, 0))
+        known = self.ids[pos] == batch_ids if len(self.ids) else np.zeros(len(batch_ids), dtype=bool)
+        kept[known] = self.tuples[pos[known]]
+        clash = np.flatnonzero(tuples != kept[group])
+        if len(clash):
+            self.collided.update(zip(ids[clash].tolist(), map(tuple, tuples[clash].tolist())))
+            self.collisions = len(self.collided)
+        ids = np.concatenate([self.ids, batch_ids[~known]])
+        tuples = np.concatenate([self.tuples, kept[~known]])
+        order = np.argsort(ids, kind="stable")
+        self.ids, self.tuples = ids[order], tuples[order]
+
+    def lookup(self, ids):
+        """(FLOW_DTYPE array, found mask) for a batch of decoded flow ids."""
+        self.compact()
+        ids = np.asarray(ids, dtype=np.int64).reshape(-1)
+        pos = np.minimum(np.searchsorted(self.ids, ids), max(len(self.ids) - 1, 0))
+        found = self.ids[pos] == ids if len(self.ids) else np.zeros(len(ids), dtype=bool)
+        tuples = np.zeros(len(ids), dtype=FLOW_DTYPE)
+        tuples[found] = self.tuples[pos[found]]
+        return tuples, found
+
+    def __len__(self):
+        self.compact()
+        return len(self.ids)
+
+    @property
+    def nbytes(self):
+        return self.ids.nbytes + self.tuples.nbytes + sum(i.nbytes + t.nbytes for i, t in self.pending)
+
+
+def decode_flows(flowset, p, index=None):
+    """
+    {5-tuple: count} for a decoded {flow id: count} dict: exactly for
+    p > 2**104, else through `index`; ids the index never saw are dropped.
+    """
+    ids = list(flowset)
+    if p > 2 ** 104:
+        tuples, found = decode_exact(ids)
+    else:
+        tuples, found = index.lookup(ids)
+    return {tuple(t.tolist()): flowset[f] for f, t, ok in zip(ids, tuples, found) if ok}
@@ -1,18 +1,48 @@
 import random
 import numpy as np
+from MRjittatVersion.bucket import g_array
+from MRjittatVersion.MrJittacore import det_many, rank_mod
 
 p = int(1e9 + 7)
-rc = 3
-prime = [2,3,5,7,11,13,17,19,23,29,31,37,41,43,47,53,59,61,67,71,73,79,83,89,97]
-prime = [[prime[i + j * rc] for i in range(rc)] for j in range(rc)]
-k = 2
-# trial = 
-# for 
-flow = [random.randint(1,1000) for _ in range(k)]
-a = [random.randint(1, p - 1) for _ in range(k)]
-b = [random.randint(0, p - 1) for _ in range(k)]
-g = [[prime[_][((a[_] * flow[i] + b[_]) %p ) %rc ] for i in range(k)] for _ in range(k)]
-rank = np.linalg.matrix_rank(g)
-print("flow",flow)
-print("g",g)
-print("rank",rank)
\ No newline at end of file
+
+def random_g(k, rc, trials, rng, flow_range=1000):
+	"""
+	(trials, k, k) coefficient matrices: column i holds the g values of one of
+	k random flows, row j the sub-bucket whose random (a, b) hash picks them.
+	"""
+	flow = rng.integers(1, flow_range + 1, size=(trials, 1, k))
+	a = rng.integers(1, p, size=(trials, k, 1))
+	b = rng.integers(0, p, size=(trials, k, 1))
+	h = (a * flow + b) % p % rc
+	return g_array(k, rc)[np.arange(k)[:, None], h]
+
+def full_rank_probability(k, rc, trials, rng, exact=True, batch=1 << 20):
+	"""
+	Fraction of `trials` random g matrices with rank k, computed in batches of
+	`batch` matrices: exactly over the integers (nonzero determinant) or mod p.
+	"""
+	full = 0
+	for start in range(0, trials, batch) :
+		g = random_g(k, rc, min(batch, trials - start), rng)
+		full += int(np.count_nonzero(det_many(g)) if exact else np.count_nonzero(rank_mod(g, p) == k))
+	return full / trials
+
+def full_rank_table(ks, rcs, trials, seed=None, exact=True):
+	"""{(k, rc): full-rank probability} over the grid, skipping pairs the prime table cannot cover."""
+	table = {}
+	for k in ks :
+		for rc in rcs :
+			if k * rc > 46 :
+				continue
+			table[(k, rc)] = full_rank_probability(k, rc, trials, np.random.default_rng([seed or 0, k, rc]), exact)
+	return table
+
+if __name__ == "__main__" :
+	ks = [2, 3, 4]
+	rcs = [2, 3, 4, 5, 6, 8, 10]
+	trials = 1_000_000
+	table = full_rank_table(ks, rcs, trials, seed=random.randrange(2 ** 32))
+	print("full-rank probability, trials per cell:", trials)
+	print("k \\ rc " + "".join(f"{rc:>9}" for rc in rcs))
+	for k in ks :
+		print(f"{k:>6} " + "".join(f"{table[(k, rc)]:>9.5f}" if (k, rc) in table else f"{'-':>9}" for rc in rcs))
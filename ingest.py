@@ -0,0 +1,277 @@
+import argparse
+import itertools
+import multiprocessing
+import queue
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+import numpy as np
+import sketch_format
+
+FORMATS = ("csv", "lines", "binary")
+
+
+def read_chunks(path, format="csv", chunk_size=1 << 20, column=0, delimiter=",", skip_header=0, record="<u4", field=None):
+    """
+    Yield the flow ids of a trace file as int64 arrays of at most `chunk_size`
+    records, so memory stays bounded whatever the trace size.
+
+    format:
+        "csv"    one record per line, flow id in `column` (after `skip_header` lines)
+        "lines"  one integer flow id per line
+        "binary" fixed-width records of numpy dtype `record`; for a structured
+                 record the flow id is `field`
+    """
+    if format == "binary":
+        record = np.dtype(record)
+        with open(path, "rb") as f:
+            while True:
+                chunk = np.fromfile(f, dtype=record, count=chunk_size)
+                if len(chunk) == 0:
+                    return
+                yield (chunk if field is None else chunk[field]).astype(np.int64)
+    elif format in ("csv", "lines"):
+        with open(path) as f:
+            lines = itertools.islice(f, skip_header, None)
+            while True:
+                batch = list(itertools.islice(lines, chunk_size))
+                if not batch:
+                    return
+                if format == "lines":
+                    # blank lines (a trailing newline, CRLF padding) carry no record
+                    batch = [line for line in map(str.strip, batch) if line]
+                    if batch:
+                        yield np.array(batch).astype(np.int64)
+                else:
+                    yield np.loadtxt(batch, delimiter=delimiter, usecols=column, dtype=np.int64, ndmin=1)
+    else:
+        raise ValueError(f"unknown trace format {format!r}, expected one of {FORMATS}")
+
+
+def insert_chunk(sketch, flow_ids):
+    if hasattr(sketch, "insert_many"):
+        sketch.insert_many(flow_ids)
+    else:
+        for f in flow_ids.tolist():
+            sketch.insert(f)
+
+
+def ingest(sketch, path, verbose=False, **reader):
+    """
+    Stream the trace at `path` into `sketch` chunk by chunk (`reader` is
+    passed to read_chunks) and return the throughput statistics.
+
+    Returns:
+        dict: "packets", "chunks", "seconds" and "pps" (packets per second).
+    """
+    packets = chunks = 0
+    start = time.perf_counter()
+    for flow_ids in read_chunks(path, **reader):
+        insert_chunk(sketch, flow_ids)
+        packets += len(flow_ids)
+        chunks += 1
+        if verbose:
+            print(f"chunk {chunks}: {packets} packets")
+    seconds = time.perf_counter() - start
+    return {"packets": packets, "chunks": chunks, "seconds": seconds, "pps": packets / seconds if seconds > 0 else float("inf")}
+
+
+def shard_worker(cls, meta, inbox, outbox, index):
+    """
+    Insert every chunk from `inbox` into a private shard until None arrives,
+    then send its counters back; a failure is sent back as its message.
+    """
+    try:
+        shard = cls(**meta)
+        while True:
+            flow_ids = inbox.get()
+            if flow_ids is None:
+                break
+            shard.insert_many(flow_ids)
+    except Exception as error:
+        outbox.put((index, None, f"{type(error).__name__}: {error}"))
+        return
+    outbox.put((index, shard.count, shard.id))
+
+
+def feed(inbox, item, worker, outbox, poll=1.0):
+    """Put `item` on a worker's bounded inbox, failing instead of blocking forever once the worker is gone."""
+    while True:
+        try:
+            inbox.put(item, timeout=poll)
+            return
+        except queue.Full:
+            if not worker.is_alive():
+                try:
+                    index, count, reason = outbox.get(timeout=poll)
+                except queue.Empty:
+                    count, reason = None, f"exit code {getattr(worker, 'exitcode', None)}"
+                raise RuntimeError(f"ingest worker {worker.name} exited early: {reason if count is None else 'no error reported'}")
+
+
+def collect(outbox, workers, poll=1.0):
+    """{index: (count, id)} from every shard worker, failing if one reports an error or is killed."""
+    shards = {}
+    while len(shards) < len(workers):
+        try:
+            index, count, id = outbox.get(timeout=poll)
+        except queue.Empty:
+            # a process that exits cleanly has already queued its shard; any other exit code is a crash
+            for i, worker in enumerate(workers):
+                if i not in shards and getattr(worker, "exitcode", None) not in (None, 0):
+                    raise RuntimeError(f"ingest worker {worker.name} died with exit code {worker.exitcode}")
+            continue
+        if count is None:
+            raise RuntimeError(f"ingest worker {index} failed: {id}")
+        shards[index] = count, id
+    return shards
+
+
+def sharded_ingest(sketch, chunks, workers=None, threads=False, queue_depth=4):
+    """
+    Ingest the flow id arrays of `chunks` (e.g. read_chunks(...)) into
+    `sketch` with `workers` processes (or threads, for free-threaded
+    builds), each filling a private shard with the same hash seeds. Flows
+    are partitioned by id, so a flow's packets all land on one shard, and
+    at the end of the stream the shards are summed into `sketch` with
+    merge(); no counter is shared while inserting. `queue_depth` bounds the
+    chunks waiting per worker, which keeps memory bounded. Ids keep their
+    dtype, so exact (Python int) 5-tuple keys work too. If a worker fails
+    or dies, the others are stopped and RuntimeError is raised.
+
+    Shards travel back as count/id arrays, so `sketch` must be one of the
+    array engines; an object sketch raises TypeError.
+
+    Returns:
+        dict: "packets", "chunks", "workers", "seconds", "merge_seconds" and "pps".
+    """
+    missing = [name for name in ("meta", "insert_many", "merge", "count", "id") if not hasattr(sketch, name)]
+    if missing:
+        raise TypeError(f"sharded_ingest needs an array sketch (traditional.array_sketch.ArraySketch or "
+                        f"MRjittatVersion.array_sketch.ArraySketch); {type(sketch).__name__} has no {', '.join(missing)}")
+    workers = (multiprocessing.cpu_count() or 1) if workers is None else workers
+    if threads:
+        inboxes = [queue.Queue(queue_depth) for _ in range(workers)]
+        outbox = queue.Queue()
+        spawn = threading.Thread
+    else:
+        inboxes = [multiprocessing.Queue(queue_depth) for _ in range(workers)]
+        outbox = multiprocessing.Queue()
+        spawn = multiprocessing.Process
+    meta = sketch.meta()
+    procs = [spawn(target=shard_worker, args=(type(sketch), meta, inboxes[i], outbox, i), daemon=True)
+             for i in range(workers)]
+    for proc in procs:
+        proc.start()
+
+    packets = count = 0
+    start = time.perf_counter()
+    try:
+        for flow_ids in chunks:
+            flow_ids = np.asarray(flow_ids).reshape(-1)
+            shard = (flow_ids % workers).astype(np.intp)
+            for i, inbox in enumerate(inboxes):
+                feed(inbox, flow_ids[shard == i], procs[i], outbox)
+            packets += len(flow_ids)
+            count += 1
+        for inbox, proc in zip(inboxes, procs):
+            feed(inbox, None, proc, outbox)
+        shards = collect(outbox, procs)
+    except BaseException:
+        for inbox, proc in zip(inboxes, procs):
+            if threads:
+                try:
+                    inbox.put_nowait(None)
+                except queue.Full:
+                    pass
+            else:
+                proc.terminate()
+        raise
+    for proc in procs:
+        proc.join()
+    ingested = time.perf_counter()
+    sketch.merge(*(type(sketch)(**meta, arrays=shards[i]) for i in range(workers)))
+    seconds = time.perf_counter() - start
+    return {"packets": packets, "chunks": count, "workers": workers, "seconds": seconds,
+            "merge_seconds": seconds - (ingested - start), "pps": packets / seconds if seconds > 0 else float("inf")}
+
+
+def row_worker(name, path, rows, reader):
+    """Stream the whole trace at `path` into rows `rows` of the shared sketch `name`; returns the packet count."""
+    sketch, shm = sketch_format.attach_shared(name)
+    packets = 0
+    try:
+        for flow_ids in read_chunks(path, **reader):
+            sketch.insert_many(flow_ids, rows=rows)
+            packets += len(flow_ids)
+    finally:
+        del sketch
+        shm.close()
+    return packets
+
+
+def shared_ingest(name, path, workers=None, **reader):
+    """
+    Ingest the trace at `path` into the shared-memory sketch `name` (from
+    sketch_format.create_shared) with up to one process per row: each
+    process reads the trace itself and inserts into its own block of rows,
+    so they never write the same counter and nothing is merged afterwards.
+
+    Returns:
+        dict: "packets", "workers", "seconds" and "pps".
+    """
+    shm = shared_memory.SharedMemory(name=name)
+    try:
+        rows_cnt = sketch_format.read_header(shm.buf)["meta"]["rows_cnt"]
+    finally:
+        shm.close()
+    workers = min((multiprocessing.cpu_count() or 1) if workers is None else workers, rows_cnt)
+    blocks = np.array_split(np.arange(rows_cnt), workers)
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        counts = list(executor.map(row_worker, [name] * workers, [path] * workers, blocks, [reader] * workers))
+    seconds = time.perf_counter() - start
+    return {"packets": counts[0], "workers": workers, "seconds": seconds,
+            "pps": counts[0] / seconds if seconds > 0 else float("inf")}
+
+
+def build_sketch(variant, rows, buckets, p, k, rc, seed):
+    if variant == "traditional":
+        from traditional.array_sketch import ArraySketch
+        return ArraySketch(rows, buckets, p, seed=seed)
+    from MRjittatVersion.array_sketch import ArraySketch
+    return ArraySketch(rows, buckets, p, k, rc, seed=seed)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stream a flow trace into a Fermat sketch.")
+    parser.add_argument("trace")
+    parser.add_argument("--format", choices=FORMATS, default="csv")
+    parser.add_argument("--column", type=int, default=0)
+    parser.add_argument("--skip-header", type=int, default=0)
+    parser.add_argument("--record", default="<u4", help="numpy dtype of one binary record, e.g. <u4 or <u8,<u4 (fields f0, f1, ...)")
+    parser.add_argument("--field", help="flow id field of a structured binary record")
+    parser.add_argument("--chunk-size", type=int, default=1 << 20)
+    parser.add_argument("--variant", choices=("traditional", "mrjittat"), default="traditional")
+    parser.add_argument("--rows", type=int, default=3)
+    parser.add_argument("--buckets", type=int, default=1 << 16)
+    parser.add_argument("--p", type=int, default=int(1e9 + 7))
+    parser.add_argument("--k", type=int, default=2)
+    parser.add_argument("--rc", type=int, default=10)
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--workers", type=int, default=1, help="ingest into this many merged shards")
+    parser.add_argument("--out", help="write the sketch here in the sketch_format layout")
+    args = parser.parse_args()
+
+    sketch = build_sketch(args.variant, args.rows, args.buckets, args.p, args.k, args.rc, args.seed)
+    reader = dict(format=args.format, chunk_size=args.chunk_size, column=args.column,
+                  skip_header=args.skip_header, record=args.record, field=args.field)
+    if args.workers > 1:
+        stats = sharded_ingest(sketch, read_chunks(args.trace, **reader), args.workers)
+    else:
+        stats = ingest(sketch, args.trace, **reader)
+    print(f"ingested {stats['packets']} packets in {stats['chunks']} chunks, "
+          f"{stats['seconds']:.3f} s ({stats['pps']:,.0f} packets/s)")
+    if args.out:
+        sketch_format.dump(sketch, args.out)
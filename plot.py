@@ -1,14 +1,33 @@
 import matplotlib.pyplot as plt
+from result_cache import ResultCache
+from test import SWEEP, SWEEP_FLOW_SIZES, sweep_fields
 
-# Flow sizes you tested
-flow_sizes = [40, 80, 120, 200]
+flow_sizes = SWEEP_FLOW_SIZES
+
+
+def required_buckets(cache, sketch_type, flow_sizes, **sweep):
+    """
+    Required bucket counts found by test.run_experiment(flow_sizes,
+    sketch_type, **sweep), read from the result cache. Raises LookupError
+    naming the missing flow sizes if the sweep is not cached, and
+    ValueError if cached searches disagree on a flow size.
+    """
+    found = {}
+    for entry, result in cache.find(**sweep_fields(sketch_type, **sweep)):
+        found.setdefault(entry["flow_size"], set()).add(result["buckets"])
+    missing = [flow_size for flow_size in flow_sizes if flow_size not in found]
+    if missing:
+        raise LookupError(f"{sketch_type} sweep {sweep} is not cached for flow sizes {missing}; run test.py first")
+    for flow_size in flow_sizes:
+        if len(found[flow_size]) > 1:
+            raise ValueError(f"{sketch_type} flow size {flow_size}: cached searches disagree ({sorted(found[flow_size], key=str)})")
+    return [next(iter(found[flow_size])) for flow_size in flow_sizes]
 
 # Results
-traditional = [3063, 7948, 14978, 15134]
-mrjittat   = [1024, 4384, 11558, 12033]
-k = 2
-l = 4
-row = 1
+cache = ResultCache()
+traditional = required_buckets(cache, "Traditional", flow_sizes, **SWEEP)
+mrjittat = required_buckets(cache, "MrJittat", flow_sizes, **SWEEP)
+fields = sweep_fields("MrJittat", **SWEEP)
 
 # Plot
 plt.figure(figsize=(8,5))
@@ -19,7 +38,7 @@ plt.plot(flow_sizes, mrjittat, '-s', label="New Version Sketch")
 plt.xlabel("Flow Size (Number of Items)", fontsize=12)
 plt.ylabel("Required Buckets (for ~99.9% Accuracy)", fontsize=12)
 plt.title("Bucket Requirement vs Flow Size", fontsize=14)
-plt.legend(loc ='upper left',title=f"k={k}, l={l}, row={row}")
+plt.legend(loc ='upper left',title=f"k={fields['k']}, l={fields['rc']}, row={fields['rows']}")
 
 
 plt.grid(True, linestyle="--", alpha=0.7)
@@ -0,0 +1,74 @@
+import json
+import os
+import sqlite3
+import time
+
+# bump when sketch/decoder behavior changes so old results stop matching
+CACHE_VERSION = 1
+DEFAULT_PATH = os.environ.get("FERMAT_RESULT_CACHE", "results_cache.sqlite")
+
+
+class ResultCache:
+    """
+    Persistent store of experiment results keyed by their full configuration.
+
+    A configuration is any JSON-able dict (sketch variant, rows, buckets, k,
+    rc, p, flow size, flow range, metric, seed, trials, ...); results are
+    JSON-able dicts. Entries written under another `version` are dropped on
+    open, and once more than `max_entries` are stored the least recently used
+    ones are evicted.
+    """
+    def __init__(self, path=DEFAULT_PATH, version=CACHE_VERSION, max_entries=100000):
+        self.path = path
+        self.version = version
+        self.max_entries = max_entries
+        self.db = sqlite3.connect(path)
+        self.db.execute("CREATE TABLE IF NOT EXISTS results ("
+                        "key TEXT PRIMARY KEY, version INTEGER, config TEXT, result TEXT, created REAL, used REAL)")
+        self.db.execute("DELETE FROM results WHERE version != ?", (version,))
+        self.db.commit()
+
+    @staticmethod
+    def key(config):
+        return json.dumps(config, sort_keys=True, default=str)
+
+    def get(self, config):
+        """Stored result for `config`, or None."""
+        key = self.key(config)
+        row = self.db.execute("SELECT result FROM results WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        self.db.execute("UPDATE results SET used = ? WHERE key = ?", (time.time(), key))
+        self.db.commit()
+        return json.loads(row[0])
+
+    def put(self, config, result):
+        now = time.time()
+        self.db.execute("INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?)",
+                        (self.key(config), self.version, self.key(config), json.dumps(result), now, now))
+        self.evict()
+        self.db.commit()
+
+    def evict(self):
+        excess = len(self) - self.max_entries
+        if excess > 0:
+            self.db.execute("DELETE FROM results WHERE key IN "
+                            "(SELECT key FROM results ORDER BY used LIMIT ?)", (excess,))
+
+    def find(self, **fields):
+        """All (config, result) pairs whose configuration matches every given field."""
+        found = []
+        for config, result in self.db.execute("SELECT config, result FROM results"):
+            config = json.loads(config)
+            if all(config.get(name) == value for name, value in fields.items()):
+                found.append((config, json.loads(result)))
+        return found
+
+    def __contains__(self, config):
+        return self.db.execute("SELECT 1 FROM results WHERE key = ?", (self.key(config),)).fetchone() is not None
+
+    def __len__(self):
+        return self.db.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+
+    def close(self):
+        self.db.close()
@@ -0,0 +1,117 @@
+"""Pieces shared by the traditional and MRjittat sketches, object and array engines alike."""
+
+import numpy as np
+
+
+def id_dtype(p):
+    # int64 keeps (a * f + b) and id * inverse exact while p * p fits, otherwise use Python ints
+    return np.int64 if p * p < 2 ** 63 else object
+
+
+def allocate(shape, dtype, arrays=None):
+    """(count, id) counter arrays of `shape`: zeroed, or the given pair after checking it fits."""
+    if arrays is None:
+        return np.zeros(shape, dtype=np.int64), np.zeros(shape, dtype=dtype)
+    count, id = arrays
+    if count.shape != shape or id.shape != shape or count.dtype != np.int64 or id.dtype != dtype:
+        raise ValueError(f"counter arrays must be {shape} int64/{np.dtype(dtype)}, got {count.shape} {count.dtype}/{id.shape} {id.dtype}")
+    return count, id
+
+
+def power_many(base, e, p):
+    """Element-wise pow(base, e, p) by square-and-multiply over the whole array."""
+    result = np.ones_like(base)
+    base = base % p
+    while e:
+        if e & 1:
+            result = result * base % p
+        base = base * base % p
+        e >>= 1
+    return result
+
+
+def check_params(params, shapes):
+    """Raise ValueError unless `params` has every key of `shapes`, each nested to exactly that shape."""
+    for key, shape in shapes.items():
+        if key not in params:
+            raise ValueError(f"params is missing {key!r}; expected keys {sorted(shapes)}")
+        try:
+            got = np.array(params[key], dtype=object).shape
+        except ValueError:
+            got = "ragged"
+        if got != shape:
+            raise ValueError(f"params[{key!r}] has shape {got}, this sketch needs {shape}")
+
+
+class Mergeable:
+    """
+    merge/subtract for sketches of one class built with the same shape and
+    hash seeds.
+
+    Hash seeds come from `params` (the sketch's params property) when given,
+    else from random.Random(seed), else from the global random module.
+    Sketches built from the same seed or params hash identically, so their
+    counters add up to the sketch of the combined stream. Subclasses give
+    dimensions() (everything besides params that must match) and
+    accumulate(others, sign).
+    """
+    def check_compatible(self, other):
+        if type(other) is not type(self) or other.dimensions() != self.dimensions() or other.params != self.params:
+            raise ValueError(f"cannot combine {type(other).__name__} {other.dimensions()} into {type(self).__name__} "
+                             f"{self.dimensions()}: sketches differ in class, shape or hash seeds")
+
+    def merge(self, *others):
+        """Add the counters of every sketch in `others` (same shape and seeds) into this one."""
+        return self.combine(others, 1)
+
+    def subtract(self, *others):
+        """Subtract the counters of every sketch in `others` (same shape and seeds) from this one."""
+        return self.combine(others, -1)
+
+    def combine(self, others, sign):
+        for other in others:
+            self.check_compatible(other)
+        self.accumulate(others, sign)
+        return self
+
+    def __iadd__(self, other):
+        return self.merge(other)
+
+    def __isub__(self, other):
+        return self.subtract(other)
+
+
+class ArrayCounters(Mergeable):
+    """Mergeable for sketches holding their counters in `count` and `id` arrays."""
+    def accumulate(self, others, sign):
+        op = np.add if sign > 0 else np.subtract
+        for other in others:
+            op(self.count, other.count, out=self.count)
+            op(self.id, other.id, out=self.id)
+        # every id is below p, so int64 sums cannot overflow before this single reduction
+        np.remainder(self.id, self.p, out=self.id)
+
+
+class BucketCounters(Mergeable):
+    """Mergeable for sketches made of Bucket objects, listed in order by buckets()."""
+    def accumulate(self, others, sign):
+        for other in others:
+            for bucket, theirs in zip(self.buckets(), other.buckets()):
+                bucket.count += sign * theirs.count
+                bucket.id = (bucket.id + sign * theirs.id) % self.p
+
+
+def difference(upstream, downstream):
+    """
+    {flow_id: lost packets} between two same-seed array sketches of one
+    traffic epoch, e.g. an upstream and a downstream switch, of either
+    variant. The residual upstream - downstream is computed with a single
+    np.subtract per counter array into new arrays, and only that residual
+    is decoded, so the peeling work scales with the lossy flows rather
+    than all flows. Neither sketch is modified or copied.
+    """
+    upstream.check_compatible(downstream)
+    count = np.subtract(upstream.count, downstream.count)
+    id = np.subtract(upstream.id, downstream.id)
+    np.remainder(id, upstream.p, out=id)
+    return type(upstream)(**upstream.meta(), arrays=(count, id)).peel()
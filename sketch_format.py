@@ -0,0 +1,172 @@
+"""
+Binary layout of a sketch:
+
+    MAGIC | version (u32) | header length (u32) | JSON header | padding
+    count array | padding | id array
+
+The JSON header holds the variant, its constructor arguments (rows, buckets,
+p, k, rc and every hash seed) and, per counter array, its dtype, shape and
+byte offset from the start of the file. Arrays start on ALIGN-byte
+boundaries and are stored raw in C order, so loading is np.frombuffer or
+np.memmap over the same bytes with no copy or parse step.
+"""
+
+import json
+import struct
+from multiprocessing import shared_memory
+import numpy as np
+from traditional.array_sketch import ArraySketch as TraditionalSketch
+from MRjittatVersion.array_sketch import ArraySketch as MRjittatSketch
+
+# bump when the header fields or the array layout change
+FORMAT_VERSION = 1
+MAGIC = b"FERMATSK"
+PREAMBLE = struct.Struct("<8sII")  # magic, format version, header length
+ALIGN = 64
+VARIANTS = {cls.variant: cls for cls in (TraditionalSketch, MRjittatSketch)}
+ARRAYS = ("count", "id")
+
+
+def align(n):
+    return -(-n // ALIGN) * ALIGN
+
+
+def layout(variant, meta, shape, id_dtype):
+    """(preamble + header bytes, header dict) for a sketch whose arrays have `shape`."""
+    if np.dtype(id_dtype) == object:
+        raise ValueError("ids held as Python ints (p * p >= 2**63) have no raw binary form")
+    dtypes = {"count": np.dtype(np.int64), "id": np.dtype(id_dtype)}
+    header = {"format": FORMAT_VERSION, "variant": variant, "meta": meta, "arrays": {}}
+    # the offsets depend on the header length, which depends on the offsets: iterate to a fixpoint
+    start = 0
+    while True:
+        offset = start
+        for name in ARRAYS:
+            header["arrays"][name] = {"dtype": dtypes[name].str, "shape": list(shape), "offset": offset}
+            offset = align(offset + dtypes[name].itemsize * int(np.prod(shape)))
+        text = json.dumps(header).encode()
+        size = align(PREAMBLE.size + len(text))
+        if size == start:
+            return PREAMBLE.pack(MAGIC, FORMAT_VERSION, len(text)) + text.ljust(size - PREAMBLE.size, b" "), header
+        start = size
+
+
+def chunks(sketch):
+    """Bytes-like pieces of the serialized sketch, in order; the arrays are not copied."""
+    head, header = layout(sketch.variant, sketch.meta(), sketch.count.shape, sketch.dtype)
+    yield head
+    position = len(head)
+    for name in ARRAYS:
+        offset = header["arrays"][name]["offset"]
+        if offset > position:
+            yield bytes(offset - position)
+        array = np.ascontiguousarray(getattr(sketch, name))
+        yield memoryview(array).cast("B")
+        position = offset + array.nbytes
+
+
+def dumps(sketch):
+    return b"".join(chunks(sketch))
+
+
+def dump(sketch, file):
+    """Write `sketch` to a path or a binary file object (a file, socket.makefile("wb"), ...)."""
+    if isinstance(file, (str, bytes)) or hasattr(file, "__fspath__"):
+        with open(file, "wb") as f:
+            return dump(sketch, f)
+    for chunk in chunks(sketch):
+        file.write(chunk)
+
+
+def read_header(buffer):
+    """Header dict of a serialized sketch held in any bytes-like object."""
+    magic, version, length = PREAMBLE.unpack_from(buffer, 0)
+    if magic != MAGIC:
+        raise ValueError("not a serialized sketch")
+    if version != FORMAT_VERSION:
+        raise ValueError(f"sketch format version {version} is not supported (expected {FORMAT_VERSION})")
+    return json.loads(bytes(buffer[PREAMBLE.size:PREAMBLE.size + length]))
+
+
+def build(header, arrays):
+    return VARIANTS[header["variant"]](**header["meta"], arrays=arrays)
+
+
+def loads(buffer):
+    """
+    Sketch whose counters are views into `buffer` (bytes, bytearray, mmap,
+    ...) rather than copies. Over an immutable buffer the counters are
+    read-only; pass a bytearray or a writable mmap to keep inserting.
+    """
+    header = read_header(buffer)
+    arrays = [np.frombuffer(buffer, dtype=spec["dtype"], count=int(np.prod(spec["shape"])), offset=spec["offset"])
+              .reshape(spec["shape"]) for spec in (header["arrays"][name] for name in ARRAYS)]
+    return build(header, arrays)
+
+
+def load(path, mode="r"):
+    """
+    Sketch whose counters are np.memmap views of the file at `path`; pages
+    are only read when touched. `mode` is np.memmap's: "r" read-only, "r+"
+    writes through to the file, "c" copy-on-write in memory.
+    """
+    with open(path, "rb") as f:
+        head = f.read(PREAMBLE.size)
+        header = read_header(head + f.read(PREAMBLE.unpack(head)[2]))
+    arrays = [np.memmap(path, dtype=spec["dtype"], mode=mode, offset=spec["offset"], shape=tuple(spec["shape"]))
+              for spec in (header["arrays"][name] for name in ARRAYS)]
+    return build(header, arrays)
+
+
+def size(header):
+    """Total bytes of a serialized sketch, from its header."""
+    return max(spec["offset"] + np.dtype(spec["dtype"]).itemsize * int(np.prod(spec["shape"]))
+               for spec in header["arrays"].values())
+
+
+def create(path, cls, *args, **kwargs):
+    """
+    New empty sketch `cls(*args, **kwargs)` whose counters live in a memory-
+    mapped file at `path` in this format, so it can exceed RAM and reopens
+    with load(path, "r+") after a restart. The file is created sparse: pages
+    are only allocated once inserts touch them.
+    """
+    # the header comes from the arguments alone: no counters are allocated outside the file
+    meta, shape, dtype = cls.describe(*args, **kwargs)
+    head, header = layout(cls.variant, meta, shape, dtype)
+    with open(path, "wb") as f:
+        f.write(head)
+        f.truncate(size(header))
+    return load(path, "r+")
+
+
+def create_shared(cls, *args, name=None, **kwargs):
+    """
+    New empty sketch `cls(*args, **kwargs)` laid out in this format inside a
+    multiprocessing.shared_memory block, so other processes can attach to
+    the same counters by name. Returns (sketch, shm); the creator should
+    shm.close() and shm.unlink() once every process is done with it.
+    """
+    meta, shape, dtype = cls.describe(*args, **kwargs)
+    head, header = layout(cls.variant, meta, shape, dtype)
+    shm = shared_memory.SharedMemory(name=name, create=True, size=size(header))
+    shm.buf[:len(head)] = head
+    return loads(shm.buf), shm
+
+
+def attach_shared(name, readonly=False):
+    """
+    (sketch, shm) over the shared-memory block `name` made by create_shared,
+    with no copy; a read-only attach suits a decoder that must not write.
+    Call shm.close() after dropping the sketch.
+    """
+    shm = shared_memory.SharedMemory(name=name)
+    return loads(shm.buf.toreadonly() if readonly else shm.buf), shm
+
+
+def flush(sketch):
+    """Write memory-mapped counters back to their file."""
+    for name in ARRAYS:
+        array = getattr(sketch, name)
+        if isinstance(array, np.memmap):
+            array.flush()
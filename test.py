@@ -1,10 +1,19 @@
 from traditional.sketch import Sketch as Sketch_Traditional
-from MrjittatVersion.sketch import Sketch as Sketch_Mrjittat
+from MRjittatVersion.sketch import Sketch as Sketch_Mrjittat
+from trial_runner import run_trials, run_trials_many
+from result_cache import ResultCache
+from concurrent.futures import ProcessPoolExecutor
+import inspect
 import random
 import matplotlib.pyplot as plt
-import numpy as np
 from collections import Counter
 
+# the accuracy run_experiment searches for
+RUN_TARGET = 0.99
+# the sweep __main__ runs for both sketches; plot.py reads its answers back from the result cache
+SWEEP_FLOW_SIZES = [40, 80, 120, 200]
+SWEEP = {"trials": 100, "seed": 0}
+
 def calculate_flow_accuracy(flow, recovered):
     """Flow-level accuracy: fraction of distinct flows with exact count match."""
     flow_counter = Counter(flow)
@@ -30,33 +39,73 @@ def calculate_item_recall(flow, recovered):
     # print(f"Total items: {total_items}, Missed items: {missed}, Recall: {(total_items - missed) / total_items:.4f}")
     return (total_items - missed) / total_items
 
-def mean_metric_for_config(buckets, flow_size, trials, rows, k, rc, p, flow_range, sketch_type, metric, rng, verbose=True):
-    """Run `trials` experiments for a specific bucket count and return mean metric."""
-    vals = []
-    for t in range(trials):
-        flow = random.choices(range(1, flow_range + 1), k=flow_size)
-        if sketch_type == "Traditional":
-            sketch = Sketch_Traditional(rows, buckets, p=int(p))
-        else:
-            sketch = Sketch_Mrjittat(rows, buckets, p=int(p), k=k, rc=rc)
-
+def metric_trial(rng, buckets, flow_size, rows, k, rc, p, flow_range, sketch_type, metric):
+    """One experiment: insert a random flow into a fresh sketch, decode it and score the result."""
+    flow = rng.choices(range(1, flow_range + 1), k=flow_size)
+    if sketch_type == "Traditional":
+        sketch = Sketch_Traditional(rows, buckets, p=int(p))
+        sketch.insert_many(flow)
+    else:
+        sketch = Sketch_Mrjittat(rows, buckets, p=int(p), k=k, rc=rc)
         for f in flow:
             sketch.insert(f)
-        recovered = sketch.verify()  # expected dict: {flow_id: count, ...}
+    recovered = sketch.verify()  # expected dict: {flow_id: count, ...}
+
+    if metric == 'flow':
+        return {metric: calculate_flow_accuracy(flow, recovered)}
+    return {metric: calculate_item_recall(flow, recovered)}  # 'item'
 
-        if metric == 'flow':
-            vals.append(calculate_flow_accuracy(flow, recovered))
-        else:  # 'item'
-            vals.append(calculate_item_recall(flow, recovered))
+def mean_metric_for_config(buckets, flow_size, trials, rows, k, rc, p, flow_range, sketch_type, metric, rng, verbose=True, workers=None,
+                           target_acc=None, confidence=0.95, batch_size=None, min_trials=None):
+    """
+    Run `trials` experiments for a specific bucket count and return mean metric.
+    With `target_acc`, stops as soon as the mean is confidently above or below it,
+    checking every `batch_size` trials once `min_trials` have run (see run_trials).
+    """
+    # trials run in parallel; each gets its own stream derived from one draw of `rng`
+    seed = rng.getrandbits(64)
+    result = run_trials(metric_trial, trials,
+                        (buckets, flow_size, rows, k, rc, p, flow_range, sketch_type, metric),
+                        seed=seed, workers=workers, target=target_acc, metric=metric, confidence=confidence,
+                        batch_size=batch_size, min_trials=min_trials)
+    if verbose and target_acc is not None:
+        print(f"[buckets={buckets}] used {result['trials']}/{trials} trials")
+    return result[metric]
 
-        # ---- Progress bar ----
-        # if verbose:
-            # percent = int((t + 1) * 100 / trials)
-            # print(f"\r[buckets={buckets}] Progress: {percent}% ", end="", flush=True)
+def point_config(config, buckets):
+    """Full configuration of one (config, bucket count) evaluation, as stored in the result cache."""
+    flow_size, trials, rows, k, rc, p, flow_range, sketch_type, metric, seed, target_acc, confidence, batch_size, min_trials = config
+    return {"kind": "metric", "sketch": sketch_type, "rows": rows, "buckets": buckets, "k": k, "rc": rc, "p": p,
+            "flow_size": flow_size, "flow_range": flow_range, "metric": metric, "seed": seed, "trials": trials,
+            "target": target_acc, "confidence": confidence, "batch_size": batch_size, "min_trials": min_trials}
 
-    # if verbose:
-        # print("")  # newline after finishing
-    return float(np.mean(vals))
+def evaluate_buckets(bucket_counts, config, memo, workers=None, executor=None, verbose=False, tag="eval", cache=None):
+    """
+    Mean metric for every bucket count in `bucket_counts` under `config`.
+    Points missing from `memo` (and from `cache`, when given) are evaluated concurrently on one pool and stored in both.
+    With a target in `config`, each point stops early once its decision is settled.
+    """
+    flow_size, trials, rows, k, rc, p, flow_range, sketch_type, metric, seed, target_acc, confidence, batch_size, min_trials = config
+    todo = sorted({b for b in bucket_counts if (config, b) not in memo})
+    if cache is not None:
+        for b in list(todo):
+            result = cache.get(point_config(config, b))
+            if result is not None:
+                memo[(config, b)] = result
+                todo.remove(b)
+    if todo:
+        results = run_trials_many(metric_trial, trials,
+                                  [(b, flow_size, rows, k, rc, p, flow_range, sketch_type, metric) for b in todo],
+                                  [(seed, b) for b in todo], workers=workers, executor=executor,
+                                  target=target_acc, metric=metric, confidence=confidence,
+                                  batch_size=batch_size, min_trials=min_trials)
+        for b, result in zip(todo, results):
+            memo[(config, b)] = result
+            if cache is not None:
+                cache.put(point_config(config, b), result)
+            if verbose:
+                print(f"[{tag}] buckets={b}, mean_{metric}={result[metric]:.6f}, trials={result['trials']}")
+    return {b: memo[(config, b)][metric] for b in bucket_counts}
 
 def find_min_buckets(flow_size,
                      target_acc=0.99,
@@ -71,69 +120,139 @@ def find_min_buckets(flow_size,
                      min_buckets=8,
                      max_buckets=20000,
                      seed=None,
-                     verbose=False):
+                     verbose=False,
+                     ways=4,
+                     memo=None,
+                     workers=None,
+                     executor=None,
+                     adaptive=False,
+                     confidence=0.95,
+                     batch_size=None,
+                     min_trials=None,
+                     cache=None):
     """
     Find minimum bucket count (between min_buckets and max_buckets) so that
     the mean metric >= target_acc. Metric: 'item' (item-level recall) or 'flow' (flow-level exact match).
-    Uses exponential search to find an upper bound then binary search to find minimum.
+    Uses exponential search to find an upper bound then a `ways`-ary search to find minimum,
+    evaluating up to `ways` bucket counts concurrently per step.
+    Every (config, bucket count) result is kept in `memo` (pass the same dict to reuse it across calls).
+    With `adaptive`, each point stops early once its mean is above or below target_acc at `confidence`,
+    checked every `batch_size` trials once `min_trials` have run (both default to a share of `trials`).
+    With an explicit `seed`, points and the answer are also kept in `cache` (a result_cache.ResultCache).
     Returns bucket count (int) or None if not found within max_buckets.
     """
     if metric not in ('item', 'flow'):
         raise ValueError("metric must be 'item' or 'flow'")
 
-    if seed is not None:
-        random.seed(seed)
-        np.random.seed(seed)
+    if seed is None:
+        # a throwaway seed makes results unrepeatable, so they are not worth caching
+        seed = random.getrandbits(63)
+        cache = None
+    memo = {} if memo is None else memo
+    config, search_config = search_key(flow_size, target_acc, trials, rows, k, sketch_type, metric, p, rc, flow_range,
+                                       min_buckets, max_buckets, seed, ways, adaptive, confidence, batch_size, min_trials)
+    if cache is not None:
+        answer = cache.get(search_config)
+        if answer is not None:
+            return answer["buckets"]
+
+    def evaluate(points, tag):
+        return evaluate_buckets(points, config, memo, workers, executor, verbose, tag, cache)
+
+    right = search(evaluate, target_acc, min_buckets, max_buckets, ways, verbose)
+    if cache is not None:
+        cache.put(search_config, {"buckets": right})
+    if right is None:
+        return None
 
+    # final check
+    final_mean = evaluate([right], "final")[right]
+    used = sum(result["trials"] for key, result in memo.items() if key[0] == config)
+    print(f"[final] buckets={right}, mean_{metric}={final_mean:.6f}, trials used={used}")
+    return right
+
+def search_key(flow_size, target_acc, trials, rows, k, sketch_type, metric, p, rc, flow_range,
+               min_buckets, max_buckets, seed, ways, adaptive, confidence, batch_size, min_trials):
+    """(config tuple of its points, result cache entry of its answer) for one find_min_buckets search."""
+    config = (flow_size, trials, rows, k, rc, p, flow_range, sketch_type, metric, seed,
+              target_acc if adaptive else None, confidence if adaptive else None,
+              batch_size if adaptive else None, min_trials if adaptive else None)
+    return config, dict(point_config(config, None), kind="min_buckets", buckets=None, target=target_acc,
+                        adaptive=adaptive, min_buckets=min_buckets, max_buckets=max_buckets, ways=ways)
+
+def sweep_fields(sketch_type, trials=5, seed=None, adaptive=False, batch_size=None, min_trials=None):
+    """
+    Result cache fields shared by every search run_experiment makes with these
+    arguments, the rest being find_min_buckets' defaults; flow_size and
+    min_buckets change from one search to the next and are left out.
+    """
+    args = {name: param.default for name, param in inspect.signature(find_min_buckets).parameters.items()
+            if name in inspect.signature(search_key).parameters and param.default is not param.empty}
+    args.update(flow_size=None, target_acc=RUN_TARGET, trials=trials, sketch_type=sketch_type, seed=seed,
+                adaptive=adaptive, batch_size=batch_size, min_trials=min_trials)
+    fields = search_key(**args)[1]
+    del fields["flow_size"], fields["min_buckets"]
+    return fields
+
+def search(evaluate, target_acc, min_buckets, max_buckets, ways, verbose):
+    """Exponential then `ways`-ary search for the smallest bucket count whose mean reaches target_acc."""
     # quick check at min_buckets
     low = max(1, int(min_buckets))
-    high = low
-    mean_at_low = mean_metric_for_config(low, flow_size, trials, rows, k, rc, p, flow_range, sketch_type, metric, random)
-    if verbose:
-        print(f"[check] buckets={low}, mean_{metric}={mean_at_low:.6f}")
-    if mean_at_low >= target_acc:
+    if evaluate([low], "check")[low] >= target_acc:
         return low
 
     # exponential search to find high such that mean >= target_acc or until max_buckets
-    while high <= max_buckets:
-        high = min(high * 2, max_buckets)
-        mean_high = mean_metric_for_config(high, flow_size, trials, rows, k, rc, p, flow_range, sketch_type, metric, random)
-        if verbose:
-            print(f"[exp] buckets={high}, mean_{metric}={mean_high:.6f}")
-        if mean_high >= target_acc:
-            break
-        if high == max_buckets:
+    high = None
+    while high is None:
+        points = sorted({min(low * 2 ** i, max_buckets) for i in range(1, ways + 1)})
+        means = evaluate(points, "exp")
+        for b in points:
+            if means[b] >= target_acc:
+                high = b
+                break
+            low = b
+        if high is None and low >= max_buckets:
             # not found
             if verbose:
                 print(f"Not found up to max_buckets={max_buckets}")
             return None
 
-    # now binary search between low and high (we know low < target, high >= target)
+    # now k-ary search between low and high (we know low < target, high >= target)
     left, right = low, high
-    while left < right:
-        mid = left + (right - left) // 2
-        mean_mid = mean_metric_for_config(mid, flow_size, trials, rows, k, rc, p, flow_range, sketch_type, metric, random)
-        if verbose:
-            print(f"[bin] mid={mid}, mean_{metric}={mean_mid:.6f}")
-        if mean_mid >= target_acc:
-            right = mid
-        else:
-            left = mid + 1
+    while right - left > 1:
+        step = (right - left) / (ways + 1)
+        points = sorted({left + max(1, int(step * i)) for i in range(1, ways + 1)} - {right})
+        means = evaluate(points, "search")
+        for b in points:
+            if means[b] >= target_acc:
+                right = b
+                break
+            left = b
 
-    # final check
-    final_mean = mean_metric_for_config(left, flow_size, trials, rows, k, rc, p, flow_range, sketch_type, metric, random)
-    print(f"[final] buckets={left}, mean_{metric}={final_mean:.6f}")
-    return left
+    return right
 
 
 
-def run_experiment(flow_sizes, trials=5, sketch_type="MrJittat"):
-    required_buckets = []
-    for flow_size in flow_sizes:
-        min_buckets = find_min_buckets(flow_size, target_acc=0.99, trials=trials, sketch_type=sketch_type)
-        required_buckets.append(min_buckets)
-        print(f"Flow size {flow_size}: needs {min_buckets} buckets for {sketch_type}")
-    return required_buckets
+def run_experiment(flow_sizes, trials=5, sketch_type="MrJittat", seed=None, memo=None, workers=None, adaptive=False, cache=None,
+                   batch_size=None, min_trials=None):
+    """
+    Required bucket count for every flow size. Flow sizes are searched in
+    increasing order on one shared pool, and each answer is the lower end of
+    the bracket for the next one.
+    """
+    memo = {} if memo is None else memo
+    found = {}
+    min_buckets = 8
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for flow_size in sorted(flow_sizes):
+            found[flow_size] = find_min_buckets(flow_size, target_acc=RUN_TARGET, trials=trials, sketch_type=sketch_type,
+                                                min_buckets=min_buckets, seed=seed, memo=memo, workers=workers,
+                                                executor=executor, adaptive=adaptive, cache=cache,
+                                                batch_size=batch_size, min_trials=min_trials)
+            print(f"Flow size {flow_size}: needs {found[flow_size]} buckets for {sketch_type}")
+            if found[flow_size] is not None:
+                min_buckets = found[flow_size]
+    return [found[flow_size] for flow_size in flow_sizes]
 
 
 def plot_required_buckets(flow_sizes, buckets_trad, buckets_jt):
@@ -150,10 +269,10 @@ def plot_required_buckets(flow_sizes, buckets_trad, buckets_jt):
     plt.show()
 
 
-# Parameters
-flow_sizes = [ 40, 80, 120, 200]
-buckets_trad = run_experiment(flow_sizes, trials=100, sketch_type="Traditional")
-# buckets_jt = run_experiment(flow_sizes, trials=100, sketch_type="MrJittat")
+if __name__ == "__main__":
+    cache = ResultCache()
+    buckets_trad = run_experiment(SWEEP_FLOW_SIZES, sketch_type="Traditional", cache=cache, **SWEEP)
+    buckets_jt = run_experiment(SWEEP_FLOW_SIZES, sketch_type="MrJittat", cache=cache, **SWEEP)
 
-# Plot results
-# plot_required_buckets(flow_sizes, buckets_trad, buckets_jt)
+    # Plot results
+    # plot_required_buckets(flow_sizes, buckets_trad, buckets_jt)
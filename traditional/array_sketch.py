@@ -0,0 +1,136 @@
+import random
+from collections import defaultdict
+import numpy as np
+from sketch_common import ArrayCounters, allocate, check_params, id_dtype
+from .decoder import peel_rounds
+
+
+class ArraySketch(ArrayCounters) :
+	"""Traditional Fermat sketch with count and id kept as (rows, buckets) arrays."""
+	variant = "traditional"
+
+	def __init__(self, rows_cnt, buckets_cnt, p, seed=None, params=None, arrays=None) :
+		"""
+		Hash seeds come from `seed` or `params` ({"a": [...], "b": [...]}, one
+		entry per row) as described in sketch_common.Mergeable; the same seed
+		or params also give the same hashes as traditional.sketch.Sketch.
+		`arrays` is an optional (count, id) pair of existing buffers to use as
+		counters instead of fresh zeroed ones (see sketch_format).
+		"""
+		self.rows_cnt = rows_cnt
+		self.buckets_cnt = buckets_cnt
+		self.p = p
+		self.dtype = id_dtype(p)
+		if params is None :
+			params = self.make_params(rows_cnt, p, seed)
+		check_params(params, {"a": (rows_cnt,), "b": (rows_cnt,)})
+		self._a = np.array(list(params["a"]), dtype=self.dtype)
+		self._b = np.array(list(params["b"]), dtype=self.dtype)
+		self.count, self.id = allocate((rows_cnt, buckets_cnt), self.dtype, arrays)
+		self.pure_elements = []
+		self.flowset = defaultdict(int)
+
+	@staticmethod
+	def make_params(rows_cnt, p, seed=None) :
+		"""Fresh hash seeds, drawn from random.Random(seed), else from the global random module."""
+		rng = random if seed is None else random.Random(seed)
+		a, b = [], []
+		for _ in range(rows_cnt) :
+			a.append(rng.randint(1, p - 1))
+			b.append(rng.randint(0, p - 1))
+		return {"a": a, "b": b}
+
+	@classmethod
+	def describe(cls, rows_cnt, buckets_cnt, p, seed=None, params=None) :
+		"""(meta(), counter shape, id dtype) of cls(...) with the same arguments, without allocating its counters."""
+		params = cls.make_params(rows_cnt, p, seed) if params is None else params
+		check_params(params, {"a": (rows_cnt,), "b": (rows_cnt,)})
+		meta = {"rows_cnt": rows_cnt, "buckets_cnt": buckets_cnt, "p": p,
+			"params": {"a": [int(x) for x in params["a"]], "b": [int(x) for x in params["b"]]}}
+		return meta, (rows_cnt, buckets_cnt), id_dtype(p)
+
+	@property
+	def params(self) :
+		return {"a": [int(x) for x in self._a], "b": [int(x) for x in self._b]}
+
+	def meta(self) :
+		"""Constructor arguments that rebuild an identically-hashed empty sketch."""
+		return {"rows_cnt": self.rows_cnt, "buckets_cnt": self.buckets_cnt, "p": self.p, "params": self.params}
+
+	def dimensions(self) :
+		return self.rows_cnt, self.buckets_cnt, self.p
+
+	def hash(self, f) :
+		"""Bucket index of flow `f` in every row."""
+		return ((self._a * (f % self.p) + self._b) % self.p % self.buckets_cnt).astype(np.intp)
+
+	def insert(self, f) :
+		h = self.hash(f)
+		rows = np.arange(self.rows_cnt)
+		self.count[rows, h] += 1
+		self.id[rows, h] = (self.id[rows, h] + f % self.p) % self.p
+
+	def insert_many(self, flow_ids, counts=None, rows=None) :
+		"""
+		Insert a batch of flows (optionally with per-flow packet counts) in one vectorized pass.
+		`rows` (a slice or index array) limits the update to those rows, so processes
+		sharing the counters can insert into disjoint rows concurrently.
+		"""
+		f = (np.asarray(flow_ids) % self.p).astype(self.dtype).reshape(-1)
+		c = np.ones(len(f), dtype=np.int64) if counts is None else np.broadcast_to(np.asarray(counts, dtype=np.int64), f.shape)
+		rows = np.arange(self.rows_cnt)[slice(None) if rows is None else rows]
+		h = (self._a[rows, None] * f + self._b[rows, None]) % self.p % self.buckets_cnt
+		idx = (h + rows[:, None] * self.buckets_cnt).astype(np.intp).reshape(-1)
+		count = self.count.reshape(-1)
+		id = self.id.reshape(-1)
+		np.add.at(count, idx, np.tile(c, len(rows)))
+		np.add.at(id, idx, np.tile(f * c % self.p, len(rows)))
+		if len(idx) >= len(rows) * self.buckets_cnt :
+			for r in rows :
+				self.id[r] %= self.p
+		else :
+			id[idx] %= self.p
+
+	def delete(self, f, cnt) :
+		h = self.hash(f)
+		rows = np.arange(self.rows_cnt)
+		self.count[rows, h] -= cnt
+		self.id[rows, h] = (self.id[rows, h] - f % self.p * cnt % self.p) % self.p
+
+	def is_pure(self, i, j) :
+		count = int(self.count[i, j])
+		if count <= 0 :
+			return False
+		f_prime = int(self.id[i, j]) * pow(count, self.p - 2, self.p) % self.p
+		return int(self.hash(f_prime)[i]) == j
+
+	def clear(self) :
+		"""Zero the counters in place and forget decoded flows, keeping the hash seeds."""
+		self.count.fill(0)
+		self.id.fill(0)
+		self.pure_elements = []
+		self.flowset = defaultdict(int)
+
+	def copy(self) :
+		"""Independent in-memory sketch with the same seeds and a copy of the counters."""
+		return type(self)(**self.meta(), arrays=(np.array(self.count), np.array(self.id)))
+
+	def verify(self) :
+		"""
+		Decode without modifying the counters: the peeler's writes go to a
+		sparse overlay holding only the buckets it touches, so repeated calls
+		return the same flows, read-only or larger-than-RAM memory-mapped
+		counters decode without being copied, and the sketch can still be
+		merged, stored or inserted into afterwards.
+		"""
+		self.flowset = defaultdict(int, peel_rounds(self.count, self.id, self._a, self._b, self.p, in_place=False))
+		return dict(self.flowset)
+
+	def peel(self) :
+		"""Destructive decode: peels the counters in place, leaving the undecoded residual."""
+		self.flowset = defaultdict(int, peel_rounds(self.count, self.id, self._a, self._b, self.p))
+		return dict(self.flowset)
+
+	@property
+	def nbytes(self) :
+		return self.count.nbytes + self.id.nbytes
@@ -10,9 +10,13 @@ class Bucket() :
 		self.count += 1
 		self.id = (self.id + flow_id) % self.p
 
+	def insert_many(self, id_sum, cnt):
+		self.count += cnt
+		self.id = (self.id + id_sum) % self.p
+
 	def delete(self, flow_id, cnt):
 		self.count -= cnt
-		self.id = (self.id - flow_id) % self.p
+		self.id = (self.id - flow_id * cnt) % self.p
 				
 
 	def is_pure(self, j , hash, f = None) :
@@ -0,0 +1,147 @@
+import numpy as np
+from sketch_common import power_many
+
+
+def first_unique(values) :
+	"""Indices of the first occurrence of every distinct value."""
+	order = np.argsort(values, kind="stable")
+	ordered = values[order]
+	keep = np.ones(len(order), dtype=bool)
+	keep[1:] = ordered[1:] != ordered[:-1]
+	return order[keep]
+
+
+def isin_sorted(ordered, values) :
+	"""Mask of the `values` present in the sorted array `ordered`, without a Python-level loop."""
+	found = np.zeros(len(values), dtype=bool)
+	if len(ordered) == 0 or len(values) == 0 :
+		return found
+	# sorted needles walk `ordered` front to back instead of jumping around it
+	order = np.argsort(values, kind="stable")
+	needles = values[order]
+	found[order] = ordered[np.minimum(np.searchsorted(ordered, needles), len(ordered) - 1)] == needles
+	return found
+
+
+def group_sums(keys, values) :
+	"""For every element, the sum of `values` over all elements with the same key."""
+	order = np.argsort(keys, kind="stable")
+	ordered = keys[order]
+	start = np.ones(len(order), dtype=bool)
+	start[1:] = ordered[1:] != ordered[:-1]
+	sums = np.add.reduceat(values[order], np.flatnonzero(start))
+	result = np.empty_like(sums, shape=len(order))
+	result[order] = sums[np.cumsum(start) - 1]
+	return result
+
+
+class Overlay :
+	"""
+	Copy-on-write view of a flat array for index-array reads and writes:
+	the first write to a page of `page` cells copies that page aside, reads
+	fall through to `base` for every page not copied, and `base` itself is
+	never modified. Like np.memmap(mode="c"), but only the pages the
+	peeler actually touches are held in memory.
+	"""
+	def __init__(self, base, page=512) :
+		self.base = base
+		self.dtype = base.dtype
+		self.page = page
+		self.slot = np.full(-(-len(base) // page), -1, dtype=np.intp)
+		self.pages = np.empty((0, page), dtype=base.dtype)
+		self.used = 0
+
+	def __getitem__(self, idx) :
+		values = self.base[idx]
+		slot = self.slot[idx // self.page]
+		hit = slot >= 0
+		values[hit] = self.pages[slot[hit], idx[hit] % self.page]
+		return values
+
+	def __setitem__(self, idx, values) :
+		pg = idx // self.page
+		new = pg[self.slot[pg] < 0]
+		new = new[first_unique(new)]
+		if len(new) :
+			if self.used + len(new) > len(self.pages) :
+				pages = np.empty((max(2 * len(self.pages), self.used + len(new)), self.page), dtype=self.dtype)
+				pages[:self.used] = self.pages[:self.used]
+				self.pages = pages
+			# the last page may run past the end of base; those cells are never read
+			cells = np.minimum(new[:, None] * self.page + np.arange(self.page), len(self.base) - 1)
+			self.pages[self.used:self.used + len(new)] = self.base[cells]
+			self.slot[new] = np.arange(self.used, self.used + len(new))
+			self.used += len(new)
+		self.pages[self.slot[pg], idx % self.page] = values
+
+
+def peel_rounds(count, id, a, b, p, in_place=True) :
+	"""
+	Round-based peeling over (rows, buckets) counter arrays, updated in place
+	(or, with in_place=False, through an Overlay that leaves them untouched).
+	A round walks the rows in order; in each row every candidate bucket is
+	checked at once against the counters as left by the previous rows, and
+	a pure-looking flow is only accepted if every row's bucket for it still
+	holds at least its count (summed over the flows accepted together).
+	Accepted flows are subtracted from every row right away; the next round
+	only looks at touched buckets. Buckets are always visited in ascending
+	(row, bucket) order and the first scan runs one row at a time, so
+	memory-mapped counters are paged in sequentially. Returns the recovered
+	{flow_id: count} dictionary.
+	"""
+	rows_cnt, buckets_cnt = count.shape
+	count = count.reshape(-1)
+	id = id.reshape(-1)
+	rows = np.arange(rows_cnt)[:, None]
+	flowset = {}
+	# ids decoded so far, kept sorted so candidates are checked against them with one searchsorted
+	decoded = np.empty(0, dtype=id.dtype)
+	candidates = np.concatenate([np.flatnonzero(count[r * buckets_cnt:(r + 1) * buckets_cnt] > 0) + r * buckets_cnt
+		for r in range(rows_cnt)])
+	if not in_place :
+		count, id = Overlay(count), Overlay(id)
+	while len(candidates) :
+		touched = []
+		found = False
+		bounds = np.searchsorted(candidates, np.arange(rows_cnt + 1) * buckets_cnt)
+		for r in range(rows_cnt) :
+			cand = candidates[bounds[r]:bounds[r + 1]]
+			cand = cand[count[cand] > 0]
+			c = count[cand]
+			f = id[cand] * power_many(c.astype(id.dtype), p - 2, p) % p
+			pure = (a[r] * f + b[r]) % p % buckets_cnt == cand - r * buckets_cnt
+			cand, f, c = cand[pure], f[pure], c[pure]
+			fresh = ~isin_sorted(decoded, f)
+			cand, f, c = cand[fresh], f[fresh], c[fresh]
+			if len(f) == 0 :
+				continue
+			pos = ((a[:, None] * f + b[:, None]) % p % buckets_cnt + rows * buckets_cnt).astype(np.intp)
+			# every row must still hold the flows claimed from it, or some of them are false positives
+			demand = group_sums(pos.reshape(-1), np.tile(c, rows_cnt)).reshape(pos.shape)
+			ok = (demand <= count[pos]).all(axis=0)
+			# rejected buckets are retried next round, once other flows have been peeled off
+			touched.append(cand[~ok])
+			f, c, pos = f[ok], c[ok], pos[:, ok]
+			if len(f) == 0 :
+				continue
+			found = True
+			flowset.update(zip(f.tolist(), c.tolist()))
+			new = np.sort(f)
+			decoded = np.insert(decoded, np.searchsorted(decoded, new), new)
+			pos = pos.reshape(-1)
+			order = np.argsort(pos, kind="stable")
+			pos = pos[order]
+			start = np.ones(len(pos), dtype=bool)
+			start[1:] = pos[1:] != pos[:-1]
+			starts = np.flatnonzero(start)
+			dc = np.add.reduceat(np.tile(c, rows_cnt)[order], starts)
+			did = np.add.reduceat(np.tile(f * c.astype(f.dtype) % p, rows_cnt)[order], starts)
+			pos = pos[starts]
+			count[pos] = count[pos] - dc
+			id[pos] = (id[pos] - did) % p
+			touched.append(pos)
+		if not found :
+			break
+		candidates = np.concatenate(touched)
+		candidates = candidates[first_unique(candidates)]
+	return flowset
@@ -1,4 +1,6 @@
 from .sketch import Sketch
+from trial_runner import run_trials
+from result_cache import ResultCache
 from collections import Counter
 import random
 import matplotlib.pyplot as plt
@@ -49,47 +51,49 @@ def check_flow_result(flow, s, verbose=True):
 	}
 
 
-def experiment_buckets(rows_cnt, buckets_list, element_range, element_counts, trials=5, p=int(1e9 + 7)):
-	mean_fp_list = []
-	mean_fn_list = []
-	mean_acc_list = []
-	print(f"Experimenting with rows: {rows_cnt}, element range: {element_range}, element counts: {element_counts}, trials per bucket count: {trials}")
+def bucket_trial(rng, rows_cnt, buckets_cnt, element_counts, p):
+	sketch = Sketch(rows_cnt, buckets_cnt, p)
 
-	for buckets_cnt in buckets_list:
-		fp_trials = []
-		fn_trials = []
-		print(f"Running experiments for {buckets_cnt} buckets...")
+	# Generate random elements
+	# elements = rng.sample(range(1, element_range), k=element_counts)
+	elements = [i for i in range(1,element_counts + 1)]
+	original_counts = Counter(elements)
 
-		for _ in range(trials):
-			sketch = Sketch(rows_cnt, buckets_cnt, p)
+	# Insert elements into sketch
+	sketch.insert_many(elements)
 
-			# Generate random elements
-			# elements = random.sample(range(1, element_range), k=element_counts)
-			elements = [i for i in range(1,element_counts + 1)]
-			original_counts = Counter(elements)
+	# Recover flow counts
+	recovered = sketch.verify()
 
-			# Insert elements into sketch
-			for elem in elements:
-				for row in range(rows_cnt):
-					sketch.rows[row].insert(elem)
+	# Calculate false positives and false negatives
+	fp = sum(1 for f in recovered if f not in original_counts)
+	fn = sum(1 for f in original_counts if f not in recovered)
+	return {"fp": fp, "fn": fn}
 
-			# Recover flow counts
-			recovered = sketch.verify()
 
-			# Calculate false positives and false negatives
-			fp = sum(1 for f in recovered if f not in original_counts)
-			fn = sum(1 for f in original_counts if f not in recovered)
+def experiment_buckets(rows_cnt, buckets_list, element_range, element_counts, trials=5, p=int(1e9 + 7), seed=None, workers=None, cache=None):
+	mean_fp_list = []
+	mean_fn_list = []
+	mean_acc_list = []
+	print(f"Experimenting with rows: {rows_cnt}, element range: {element_range}, element counts: {element_counts}, trials per bucket count: {trials}")
 
-			# fp_trials.append(fp / len(original_counts))  # normalized
-			fp_trials.append(fp )
-			fn_trials.append(fn )
-			# fn_trials.append(fn / len(original_counts))  # normalized
+	for buckets_cnt in buckets_list:
+		print(f"Running experiments for {buckets_cnt} buckets...")
+		# only seeded runs are repeatable, so only those go through the result cache
+		config = {"kind": "experiment_buckets", "sketch": "Traditional", "rows": rows_cnt, "buckets": buckets_cnt,
+			"element_counts": element_counts, "p": p, "trials": trials, "seed": seed}
+		result = cache.get(config) if cache is not None and seed is not None else None
+		if result is None:
+			result = run_trials(bucket_trial, trials, (rows_cnt, buckets_cnt, element_counts, p),
+				seed=None if seed is None else (seed, buckets_cnt), workers=workers)
+			if cache is not None and seed is not None:
+				cache.put(config, result)
 
 		# Compute mean for this bucket count
-		print("success_rate : ", (element_counts - (sum(fn_trials) + sum(fp_trials))/ trials) / element_counts * 100)
-		mean_fp_list.append(sum(fp_trials) / trials)
-		mean_fn_list.append(sum(fn_trials) / trials)
-		acc = (element_counts - (sum(fn_trials) + sum(fp_trials))/ trials) / element_counts * 100
+		acc = (element_counts - (result["fn"] + result["fp"])) / element_counts * 100
+		print("success_rate : ", acc)
+		mean_fp_list.append(result["fp"])
+		mean_fn_list.append(result["fn"])
 		mean_acc_list.append(acc)
 
 		if debug:
@@ -123,7 +127,7 @@ if __name__ == "__main__":
 	element_counts = 100
 	trials = 1000 # number of experiments per row count
 
-	fp_list, fn_list ,acc = experiment_buckets(2, bucket_list, element_range, element_counts, trials)
+	fp_list, fn_list ,acc = experiment_buckets(2, bucket_list, element_range, element_counts, trials, seed=0, cache=ResultCache())
 	# fp_list, fn_list = experiment_element_range(3, 40000, element_range_list, element_counts, trials)
 	plot_results_buckets(bucket_list, fp_list, fn_list,acc)
 	# plot_results_element_range(element_range_list, fp_list, fn_list)
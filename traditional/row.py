@@ -1,11 +1,13 @@
 import random
+import numpy as np
+from sketch_common import id_dtype
 from .bucket import Bucket
 class Rows() :
-	def __init__(self,size,p):
+	def __init__(self,size,p,rng=random,a=None,b=None):
 		self.size = size
 		self.buckets = [Bucket(p) for _ in range(size)]
-		self._a = random.randint(1, p - 1)
-		self._b = random.randint(0, p - 1)
+		self._a = rng.randint(1, p - 1) if a is None else a
+		self._b = rng.randint(0, p - 1) if b is None else b
 		self.p = p
 		self.bucket_size = size
 
@@ -17,10 +19,22 @@ class Rows() :
 		self.buckets[h].insert(f)
 		return h
 
+	def insert_many(self, flow_ids, counts=None):
+		f = (np.asarray(flow_ids) % self.p).astype(id_dtype(self.p)).reshape(-1)
+		c = np.ones(len(f), dtype=np.int64) if counts is None else np.broadcast_to(np.asarray(counts, dtype=np.int64), f.shape)
+		h = self.hash(f).astype(np.intp)
+		cnt = np.zeros(self.bucket_size, dtype=np.int64)
+		id_sum = np.zeros(self.bucket_size, dtype=f.dtype)
+		np.add.at(cnt, h, c)
+		np.add.at(id_sum, h, f * c % self.p)
+		touched = np.flatnonzero(cnt)
+		for j, n, s in zip(touched.tolist(), cnt[touched].tolist(), (id_sum[touched] % self.p).tolist()):
+			self.buckets[j].insert_many(s, n)
+		return h
+
 	
 	def delete(self, f, cnt) :
 		h = self.hash(f)
 		self.buckets[h].delete(f,cnt)
 			
 				
-
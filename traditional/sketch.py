@@ -1,41 +1,69 @@
-from collections import deque, defaultdict
+import random
+from collections import defaultdict
+import numpy as np
+from sketch_common import BucketCounters, check_params, id_dtype
 from .row import Rows
+from .decoder import peel_rounds
 
 
-class Sketch :
-	def __init__(self, rows_cnt, buckets_cnt, p) :
+class Sketch(BucketCounters) :
+	def __init__(self, rows_cnt, buckets_cnt, p, seed=None, params=None) :
+		"""
+		Hash seeds come from `seed` or `params` ({"a": [...], "b": [...]}, one
+		entry per row) as described in sketch_common.Mergeable.
+		"""
 		self.rows_cnt = rows_cnt
 		self.p = p
-		self.rows = [Rows(buckets_cnt, p) for _ in range(rows_cnt)]
+		if params is not None :
+			check_params(params, {"a": (rows_cnt,), "b": (rows_cnt,)})
+			self.rows = [Rows(buckets_cnt, p, a=a, b=b) for a, b in zip(params["a"], params["b"])]
+		else :
+			rng = random if seed is None else random.Random(seed)
+			self.rows = [Rows(buckets_cnt, p, rng) for _ in range(rows_cnt)]
 		self.pure_elements = []
 		self.flowset = defaultdict(int)
 
+	@property
+	def params(self) :
+		return {"a": [row._a for row in self.rows], "b": [row._b for row in self.rows]}
+
+	def dimensions(self) :
+		return self.rows_cnt, self.rows[0].size, self.p
+
 	def insert(self,f) :
 		for row in self.rows:
 			row.insert(f)
 
+	def insert_many(self, flow_ids, counts=None) :
+		for row in self.rows:
+			row.insert_many(flow_ids, counts)
+
+	def buckets(self) :
+		return [bucket for row in self.rows for bucket in row.buckets]
+
+	def arrays(self) :
+		"""(count, id, a, b) arrays exported from the buckets and row hashes, for peel_rounds."""
+		dtype = id_dtype(self.p)
+		count = np.array([[bucket.count for bucket in row.buckets] for row in self.rows], dtype=np.int64)
+		id = np.array([[bucket.id for bucket in row.buckets] for row in self.rows], dtype=dtype)
+		a = np.array([row._a for row in self.rows], dtype=dtype)
+		b = np.array([row._b for row in self.rows], dtype=dtype)
+		return count, id, a, b
+
 	def verify(self):
-		queue = deque()
-		checked_pure = set()
-		for i, row in enumerate(self.rows):
-			for j, bucket in enumerate(row.buckets):
-				if bucket.count != 0:
-					queue.append((i, j))
-		while queue:
-			i, j = queue.popleft()
-			bucket = self.rows[i].buckets[j]
-			# print(f"Processing bucket at row {i}, index {j} with count {bucket.count} and id {bucket.id}")
-			if bucket.is_pure(j, self.rows[i].hash):
-				f_prime = bucket.id * pow(bucket.count, self.p - 2, self.p) % self.p
-				if f_prime in checked_pure:
-					continue
-				self.flowset[f_prime] += bucket.count
-				checked_pure.add(f_prime)
-				count = bucket.count
-				# print(f"Found pure bucket! Flow ID: {f_prime}, Count: {bucket.count}")
-				for i2, row2 in enumerate(self.rows):
-					h = row2.hash(f_prime)
-					row2.buckets[h].delete(f_prime, count)
+		"""
+		Decode without changing the sketch: the counters are exported to
+		arrays and those are peeled, so repeated calls return the same flows
+		and the buckets are never written.
+		"""
+		self.flowset = defaultdict(int, peel_rounds(*self.arrays(), self.p))
 		return dict(self.flowset)
 
-
+	def peel(self):
+		"""Destructive decode: like verify(), but the residual is written back to the buckets."""
+		count, id, a, b = self.arrays()
+		self.flowset = defaultdict(int, peel_rounds(count, id, a, b, self.p))
+		for row, counts, ids in zip(self.rows, count.tolist(), id.tolist()) :
+			for bucket, c, i in zip(row.buckets, counts, ids) :
+				bucket.count, bucket.id = c, i
+		return dict(self.flowset)
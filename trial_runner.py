@@ -0,0 +1,166 @@
+import math
+import os
+import random
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+
+def trial_seeds(seed, index):
+    """Two independent seeds for trial `index` of a run: one for the trial's rng, one for the global RNGs."""
+    entropy = list(seed) if isinstance(seed, (tuple, list)) else seed
+    state = np.random.SeedSequence(entropy, spawn_key=(index,)).generate_state(2, dtype=np.uint64)
+    return int(state[0]), int(state[1])
+
+
+def run_chunk(trial_fn, args, seed, start, stop):
+    """Run trials start..stop-1 in this process and return their metric dicts in order."""
+    results = []
+    for index in range(start, stop):
+        rng_seed, global_seed = trial_seeds(seed, index)
+        # sketches draw their hash seeds from the global RNGs
+        random.seed(global_seed)
+        np.random.seed(global_seed % 2 ** 32)
+        results.append(trial_fn(random.Random(rng_seed), *args))
+    return results
+
+
+def run_local(trial_fn, args, seed, start, stop):
+    """run_chunk in this process, putting the caller's global RNG states back afterwards."""
+    state = random.getstate(), np.random.get_state()
+    try:
+        return run_chunk(trial_fn, args, seed, start, stop)
+    finally:
+        random.setstate(state[0])
+        np.random.set_state(state[1])
+
+
+def merge_metrics(results):
+    """Mean of every metric over a list of per-trial metric dicts, plus the trial count."""
+    merged = {key: float(np.mean([r[key] for r in results])) for key in results[0]} if results else {}
+    merged["trials"] = len(results)
+    return merged
+
+
+def half_width(n, variance, confidence, look=1):
+    """Empirical-Bernstein half-width after `n` values with sample variance `variance` (see settled)."""
+    delta = (1 - confidence) / (look * (look + 1))
+    log_term = math.log(4 / delta)
+    return math.sqrt(2 * variance * log_term / n) + 7 * log_term / (3 * (n - 1))
+
+
+def settle_trials(target, confidence):
+    """
+    (below, above): the fewest trials after which a run whose values are
+    all 0, resp. all 1, is settled against `target` at the first look.
+    No run can stop early with fewer trials than that on its side, e.g.
+    a 0.99 target at 95% needs over a thousand trials to be confirmed.
+    """
+    def fewest(gap):
+        n = 2
+        while half_width(n, 0.0, confidence) >= gap:
+            n *= 2
+        low = n // 2
+        while n - low > 1:
+            mid = (low + n) // 2
+            low, n = (low, mid) if half_width(mid, 0.0, confidence) < gap else (mid, n)
+        return n
+    return fewest(target), fewest(1 - target)
+
+
+def settled(values, target, confidence, look=1):
+    """
+    True once an empirical-Bernstein confidence interval on the mean of
+    `values` (each in [0, 1]) lies entirely above or below `target`.
+
+    The interval stays valid when the same run is checked again and again:
+    the `look`-th check only spends 1 / (look * (look + 1)) of the error
+    budget 1 - confidence, and those shares add up to the whole budget.
+    Unlike a normal approximation, it does not shrink to nothing when every
+    value is the same.
+    """
+    n = len(values)
+    if n < 2:
+        return False
+    mean = float(np.mean(values))
+    half = half_width(n, float(np.var(values, ddof=1)), confidence, look)
+    return mean - half > target or mean + half < target
+
+
+def run_trials(trial_fn, trials, args=(), seed=None, workers=None, chunk_size=None, executor=None,
+               target=None, metric=None, confidence=0.95, batch_size=None, min_trials=None):
+    """
+    Run `trials` independent Monte-Carlo trials and merge their metrics.
+
+    trial_fn(rng, *args) must be a module-level function returning a dict of
+    metrics; `rng` is a random.Random private to the trial. Every trial gets
+    its own stream derived from (seed, trial index), so results for a given
+    seed are identical whatever the number of workers or the chunking.
+
+    Trials are fanned out over a ProcessPoolExecutor in chunks (`workers`
+    defaults to the CPU count; workers=1 runs in this process). Pass an
+    existing `executor` to share one pool between several runs.
+
+    With a `target`, trials run in batches of `batch_size` (default: an
+    eighth of `trials`) and, once at least `min_trials` (default: one
+    batch) have run, stop early as soon as the `confidence` interval on
+    the running mean of `metric` (a value in [0, 1]) is entirely above or
+    below the target (see settled); `trials` is then only the cap. A run
+    capped below settle_trials() on one side of the target can only stop
+    early on the other side, which is warned about.
+
+    Returns:
+        dict: mean of each metric, plus "trials" (the number actually run).
+    """
+    return run_trials_many(trial_fn, trials, [args], [seed], workers, chunk_size, executor,
+                           target, metric, confidence, batch_size, min_trials)[0]
+
+
+def run_trials_many(trial_fn, trials, args_list, seeds, workers=None, chunk_size=None, executor=None,
+                    target=None, metric=None, confidence=0.95, batch_size=None, min_trials=None):
+    """
+    run_trials for several argument tuples (one seed each) with all of their
+    chunks in flight on the same pool, so independent configurations are
+    evaluated concurrently. Returns one merged dict per argument tuple.
+    """
+    seeds = [np.random.SeedSequence().entropy if seed is None else seed for seed in seeds]
+    workers = (os.cpu_count() or 1) if workers is None else workers
+    batch_size = max(1, -(-trials // 8)) if batch_size is None else batch_size
+    min_trials = batch_size if min_trials is None else min_trials
+    if target is not None and trials < max(settle_trials(target, confidence)):
+        below, above = settle_trials(target, confidence)
+        warnings.warn(f"{trials} trials cannot settle a mean of {metric} {'above' if above > below else 'below'} "
+                      f"{target} at {confidence} confidence (needs {max(below, above)}); such points run every trial")
+    step = trials if target is None else batch_size
+    if chunk_size is None:
+        chunk_size = max(1, -(-step // (4 * workers)))
+
+    own = executor is None and workers > 1
+    if own:
+        executor = ProcessPoolExecutor(max_workers=workers)
+    try:
+        results = [[] for _ in args_list]
+        active = list(range(len(args_list)))
+        done = looks = 0
+        # batch boundaries only depend on batch_size, so early stopping is reproducible too
+        while active and done < trials:
+            stop = min(done + step, trials)
+            chunks = [(start, min(start + chunk_size, stop)) for start in range(done, stop, chunk_size)]
+            if executor is None:
+                for i in active:
+                    for start, end in chunks:
+                        results[i].extend(run_local(trial_fn, args_list[i], seeds[i], start, end))
+            else:
+                futures = [(i, executor.submit(run_chunk, trial_fn, args_list[i], seeds[i], start, end))
+                           for i in active for start, end in chunks]
+                for i, future in futures:
+                    results[i].extend(future.result())
+            done = stop
+            if target is not None and done >= min_trials:
+                looks += 1
+                active = [i for i in active
+                          if not settled([r[metric] for r in results[i]], target, confidence, looks)]
+        return [merge_metrics(r) for r in results]
+    finally:
+        if own:
+            executor.shutdown()